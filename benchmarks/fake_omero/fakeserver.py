@@ -0,0 +1,844 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+In-memory OMERO server backing the stand-in omero package next to this
+module. A Store holds a synthetic Screen/Plate/Well/Image/Channel and
+Project/Dataset/Image hierarchy, the query service answers the HQL shapes
+used by the scripts of this repository and the update service writes
+saved objects back into the Store. Every service call is counted as one
+round trip and can be slowed down by a fixed latency.
+
+Queries are matched by shape rather than parsed: a query this module does
+not know raises ApiUsageException, so a script change that introduces a
+new query shape needs a matching handler here.
+"""
+
+from __future__ import absolute_import
+
+import bisect
+import itertools
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+import omero
+from omero import model
+from omero.rtypes import rint, rlong, rstring
+
+_current = None
+
+
+def install(server):
+    """
+    Make server the one new scripts.client instances connect to.
+    """
+    global _current
+    _current = server
+    return server
+
+
+def current():
+    if _current is None:
+        raise omero.ServerError("No fakeserver installed")
+    return _current
+
+
+class Store(object):
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self._cache = {}
+        self.screens = {}          # screen id -> name
+        self.screen_plates = {}    # screen id -> [plate id]
+        self.plates = {}           # plate id -> name
+        self.plate_wells = {}      # plate id -> [well id]
+        self.wells = {}            # well id -> (plate id, row, column)
+        self.well_samples = {}     # well id -> [well sample id]
+        self.samples = {}          # well sample id -> [well, image, pa]
+        self.acquisitions = {}     # plate acquisition id -> plate id
+        self.acquired = {}         # plate acquisition id -> {sample id}
+        self.images = {}           # image id -> name
+        self.image_lcs = {}        # image id -> [lc id] in channel order
+        self.lcs = {}              # lc id -> [name, image id]
+        self.projects = {}         # project id -> name
+        self.datasets = {}         # dataset id -> name
+        self.project_links = {}    # project id -> [link id]
+        self.dataset_links = {}    # dataset id -> [link id]
+        self.pd_links = {}         # link id -> (project id, dataset id)
+        self.di_links = {}         # link id -> (dataset id, image id)
+        self.files = {}            # original file id -> (name, bytes)
+        self.file_annotations = {}  # annotation id -> (file id, ns)
+        self.tables = {}           # target id -> populated columns
+
+    def newId(self):
+        return next(self._ids)
+
+    def changed(self):
+        """
+        Invalidate the cached id lists after a structural change.
+        """
+        self._cache.clear()
+
+    def cached(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    # Creation
+
+    def addScreen(self, name):
+        screen_id = self.newId()
+        self.screens[screen_id] = name
+        self.screen_plates[screen_id] = []
+        return screen_id
+
+    def addPlate(self, name, screen_id=None):
+        plate_id = self.newId()
+        self.plates[plate_id] = name
+        self.plate_wells[plate_id] = []
+        if screen_id is not None:
+            self.screen_plates[screen_id].append(plate_id)
+        return plate_id
+
+    def addWell(self, plate_id, row, column):
+        well_id = self.newId()
+        self.wells[well_id] = (plate_id, row, column)
+        self.well_samples[well_id] = []
+        self.plate_wells[plate_id].append(well_id)
+        return well_id
+
+    def addWellSample(self, well_id, image_id, acquisition_id=None):
+        sample_id = self.newId()
+        self.samples[sample_id] = [well_id, image_id, None]
+        self.well_samples[well_id].append(sample_id)
+        self.setAcquisition(sample_id, acquisition_id)
+        return sample_id
+
+    def addAcquisition(self, plate_id):
+        acquisition_id = self.newId()
+        self.acquisitions[acquisition_id] = plate_id
+        self.acquired[acquisition_id] = set()
+        return acquisition_id
+
+    def setAcquisition(self, sample_id, acquisition_id):
+        sample = self.samples[sample_id]
+        if sample[2] is not None:
+            self.acquired[sample[2]].discard(sample_id)
+        sample[2] = acquisition_id
+        if acquisition_id is not None:
+            self.acquired[acquisition_id].add(sample_id)
+
+    def addImage(self, name, channel_names):
+        image_id = self.newId()
+        self.images[image_id] = name
+        lc_ids = []
+        for channel_name in channel_names:
+            lc_id = self.newId()
+            self.lcs[lc_id] = [channel_name, image_id]
+            lc_ids.append(lc_id)
+        self.image_lcs[image_id] = lc_ids
+        return image_id
+
+    def addProject(self, name):
+        project_id = self.newId()
+        self.projects[project_id] = name
+        self.project_links[project_id] = []
+        return project_id
+
+    def addDataset(self, name, project_id=None):
+        dataset_id = self.newId()
+        self.datasets[dataset_id] = name
+        self.dataset_links[dataset_id] = []
+        if project_id is not None:
+            self.linkDataset(project_id, dataset_id)
+        return dataset_id
+
+    def linkDataset(self, project_id, dataset_id):
+        link_id = self.newId()
+        self.pd_links[link_id] = (project_id, dataset_id)
+        self.project_links[project_id].append(link_id)
+        return link_id
+
+    def linkImage(self, dataset_id, image_id):
+        link_id = self.newId()
+        self.di_links[link_id] = (dataset_id, image_id)
+        self.dataset_links[dataset_id].append(link_id)
+        return link_id
+
+    # Removal
+
+    def removeWellSample(self, sample_id):
+        self.setAcquisition(sample_id, None)
+        well_id = self.samples.pop(sample_id)[0]
+        self.well_samples[well_id].remove(sample_id)
+
+    def removeAcquisition(self, acquisition_id):
+        """
+        Graph delete of a PlateAcquisition: WellSamples still pointing at
+        it go with it.
+        """
+        for sample_id in list(self.acquired.get(acquisition_id, ())):
+            self.removeWellSample(sample_id)
+        self.acquisitions.pop(acquisition_id, None)
+        self.acquired.pop(acquisition_id, None)
+
+    # Traversal
+
+    def plateImageIds(self, plate_id):
+        return [self.samples[sample_id][1]
+                for well_id in self.plate_wells.get(plate_id, [])
+                for sample_id in self.well_samples[well_id]]
+
+    def datasetImageIds(self, dataset_id):
+        return [self.di_links[link_id][1]
+                for link_id in self.dataset_links.get(dataset_id, [])]
+
+    def imageIds(self, root, ids):
+        """
+        Ids of the images below a list of containers of type root.
+        """
+        image_ids = []
+        for obj_id in ids:
+            if root == "image":
+                if obj_id in self.images:
+                    image_ids.append(obj_id)
+            elif root == "well":
+                image_ids.extend(
+                    self.samples[sample_id][1]
+                    for sample_id in self.well_samples.get(obj_id, []))
+            elif root == "plate":
+                image_ids.extend(self.plateImageIds(obj_id))
+            elif root == "screen":
+                for plate_id in self.screen_plates.get(obj_id, []):
+                    image_ids.extend(self.plateImageIds(plate_id))
+            elif root == "dataset":
+                image_ids.extend(self.datasetImageIds(obj_id))
+            elif root == "project":
+                for link_id in self.project_links.get(obj_id, []):
+                    image_ids.extend(
+                        self.datasetImageIds(self.pd_links[link_id][1]))
+        return image_ids
+
+    def childIds(self, kind, parent_ids):
+        """
+        Child ids of the kind ("screenplate", "projectdataset" or
+        "datasetimage") links of the parents.
+        """
+        child_ids = []
+        for parent_id in parent_ids:
+            if kind == "screenplate":
+                child_ids.extend(self.screen_plates.get(parent_id, []))
+            elif kind == "projectdataset":
+                child_ids.extend(
+                    self.pd_links[link_id][1]
+                    for link_id in self.project_links.get(parent_id, []))
+            elif kind == "datasetimage":
+                child_ids.extend(self.datasetImageIds(parent_id))
+        return child_ids
+
+    # Model objects
+
+    def imageObject(self, image_id):
+        image = model.ImageI(image_id)
+        image.name = rstring(self.images[image_id])
+        pixels = model.PixelsI(image_id)
+        lc_ids = self.image_lcs[image_id]
+        pixels.sizeC = rint(len(lc_ids))
+        for lc_id in lc_ids:
+            channel = model.ChannelI(lc_id)
+            channel.logicalChannel = self.lcObject(lc_id)
+            pixels._channels.append(channel)
+        image._pixels.append(pixels)
+        return image
+
+    def lcObject(self, lc_id):
+        lc = model.LogicalChannelI(lc_id)
+        lc.name = rstring(self.lcs[lc_id][0])
+        return lc
+
+    def datasetObject(self, dataset_id, links=True):
+        dataset = model.DatasetI(dataset_id)
+        dataset.name = rstring(self.datasets[dataset_id])
+        if links:
+            for link_id in self.dataset_links[dataset_id]:
+                image_id = self.di_links[link_id][1]
+                link = model.DatasetImageLinkI(link_id)
+                link.parent = dataset
+                link.child = model.ImageI(image_id)
+                link.child.name = rstring(self.images[image_id])
+                dataset._imageLinks.append(link)
+        return dataset
+
+    def wellSampleObject(self, sample_id, well=None):
+        well_id, image_id, acquisition_id = self.samples[sample_id]
+        sample = model.WellSampleI(sample_id)
+        sample.well = well or model.WellI(well_id, False)
+        sample.image = model.ImageI(image_id, False)
+        if acquisition_id is not None:
+            sample.plateAcquisition = model.PlateAcquisitionI(
+                acquisition_id, False)
+        return sample
+
+    def wellObject(self, well_id, samples=True):
+        plate_id, row, column = self.wells[well_id]
+        well = model.WellI(well_id)
+        well.plate = model.PlateI(plate_id, False)
+        well.row = rint(row)
+        well.column = rint(column)
+        if samples:
+            well._wellSamples = [
+                self.wellSampleObject(sample_id, well)
+                for sample_id in self.well_samples[well_id]]
+        return well
+
+    def plateObject(self, plate_id, wells=True):
+        plate = model.PlateI(plate_id)
+        plate.name = rstring(self.plates[plate_id])
+        if wells:
+            plate._wells = [self.wellObject(well_id)
+                            for well_id in self.plate_wells[plate_id]]
+        return plate
+
+    def find(self, obj_type, obj_id):
+        """
+        Bare object of obj_type, None if there is no such object.
+        """
+        names = {
+            "Screen": self.screens, "Plate": self.plates,
+            "Project": self.projects, "Dataset": self.datasets,
+            "Image": self.images,
+        }
+        if obj_type == "PlateAcquisition":
+            if obj_id not in self.acquisitions:
+                return None
+            acquisition = model.PlateAcquisitionI(obj_id)
+            acquisition.plate = model.PlateI(
+                self.acquisitions[obj_id], False)
+            return acquisition
+        if obj_type not in names:
+            raise omero.ApiUsageException("Unsupported type %s" % obj_type)
+        if obj_id not in names[obj_type]:
+            return None
+        obj = getattr(model, "%sI" % obj_type)(obj_id)
+        obj.name = rstring(names[obj_type][obj_id])
+        return obj
+
+
+def populate(store, images, channels=3, wells_per_plate=384, columns=24,
+             fields=1, images_per_group=100):
+    """
+    Fill store with a Screen of Plates holding images and a Project
+    "Source" with a Dataset "Slides" linking the same images, plus an
+    empty Project "Target". Images are named
+    "SLIDE-<group>-<index>.svs", images_per_group images per group, so
+    that the default copy regex routes them to one dataset per group.
+    Returns a dict of the ids of the roots.
+    """
+    channel_names = ["Channel %d" % c for c in range(channels)]
+    screen_id = store.addScreen("Screen")
+    source_id = store.addProject("Source")
+    dataset_id = store.addDataset("Slides", source_id)
+    target_id = store.addProject("Target")
+    plate_ids = []
+    plate_id = well_id = None
+    for i in range(images):
+        sample = i % (wells_per_plate * fields)
+        if sample == 0:
+            plate_id = store.addPlate(
+                "Plate %d" % len(plate_ids), screen_id)
+            plate_ids.append(plate_id)
+        if sample % fields == 0:
+            well = sample // fields
+            well_id = store.addWell(
+                plate_id, well // columns, well % columns)
+        image_id = store.addImage(
+            "SLIDE-%05d-%07d.svs" % (i // images_per_group, i),
+            channel_names)
+        store.addWellSample(well_id, image_id)
+        store.linkImage(dataset_id, image_id)
+    store.changed()
+    return {
+        "screen": screen_id, "plates": plate_ids,
+        "source_project": source_id, "source_dataset": dataset_id,
+        "target_project": target_id,
+    }
+
+
+def _after(ids, last):
+    """
+    The part of a sorted id list greater than last.
+    """
+    if last is None:
+        return ids
+    return ids[bisect.bisect_right(ids, last):]
+
+
+def _page(items, params):
+    offset, limit = params.paging()
+    if limit is None:
+        return items[offset:] if offset else items
+    return items[offset:offset + limit]
+
+
+class QueryService(object):
+    """
+    Query service answering the HQL shapes of the scripts from the Store.
+    Handlers take (store, match, values, params) and return the result.
+    """
+
+    SHAPES = []
+
+    def __init__(self, server):
+        self.server = server
+
+    @classmethod
+    def shape(cls, pattern):
+        def register(handler):
+            cls.SHAPES.append((re.compile(pattern), handler))
+            return handler
+        return register
+
+    def dispatch(self, query, params):
+        normalized = " ".join(query.lower().split())
+        for pattern, handler in self.SHAPES:
+            match = pattern.match(normalized)
+            if match is not None:
+                return handler(self.server.store, match,
+                               params.values() if params else {}, params)
+        raise omero.ApiUsageException(
+            "fakeserver does not support the query: %s" % normalized)
+
+    def projection(self, query, params, ctx=None):
+        return self.server.call(
+            "query.projection", lambda: self.dispatch(query, params))
+
+    def findAllByQuery(self, query, params, ctx=None):
+        return self.server.call(
+            "query.findAllByQuery", lambda: self.dispatch(query, params))
+
+    def findByQuery(self, query, params, ctx=None):
+        def find():
+            result = self.dispatch(query, params)
+            if len(result) > 1:
+                raise omero.ApiUsageException(
+                    "findByQuery returned %d objects" % len(result))
+            return result[0] if result else None
+        return self.server.call("query.findByQuery", find)
+
+    def find(self, obj_type, obj_id, ctx=None):
+        return self.server.call(
+            "query.find", lambda: self.server.store.find(obj_type, obj_id))
+
+    def get(self, obj_type, obj_id, ctx=None):
+        def get():
+            obj = self.server.store.find(obj_type, obj_id)
+            if obj is None:
+                raise omero.ApiUsageException(
+                    "No %s with id %s" % (obj_type, obj_id))
+            return obj
+        return self.server.call("query.get", get)
+
+
+shape = QueryService.shape
+
+
+@shape(r"^select (count\()?distinct lc\.id\)? from (\w+) as \w+ .*"
+       r"where \w+\.id in \(:ids\)( and lc\.id > :last)?"
+       r"( order by lc\.id)?$")
+def _lcIds(store, match, values, params):
+    root = match.group(2)
+    key = ("lc", root, tuple(values["ids"]))
+    lc_ids = store.cached(key, lambda: sorted(set(
+        lc_id for image_id in store.imageIds(root, values["ids"])
+        for lc_id in store.image_lcs[image_id])))
+    lc_ids = _after(lc_ids, values.get("last"))
+    if match.group(1):
+        return [[rlong(len(lc_ids))]]
+    return [[rlong(lc_id)] for lc_id in _page(lc_ids, params)]
+
+
+@shape(r"^select distinct i\.id from image i .*where lc\.id in \(:ids\)$")
+def _lcImageIds(store, match, values, params):
+    image_ids = sorted(set(store.lcs[lc_id][1] for lc_id in values["ids"]
+                           if lc_id in store.lcs))
+    return [[rlong(image_id)] for image_id in _page(image_ids, params)]
+
+
+@shape(r"^select i from image i left outer join fetch i\.pixels .*"
+       r"where i\.id in \(:ids\)$")
+def _images(store, match, values, params):
+    image_ids = sorted(set(image_id for image_id in values["ids"]
+                           if image_id in store.images))
+    return [store.imageObject(image_id)
+            for image_id in _page(image_ids, params)]
+
+
+@shape(r"^select i\.id, index\(c\), lc\.id, p\.sizec from image i .*"
+       r"where i\.id in \(:ids\)$")
+def _channelRows(store, match, values, params):
+    rows = []
+    for image_id in sorted(set(values["ids"])):
+        lc_ids = store.image_lcs.get(image_id, [])
+        for index, lc_id in enumerate(lc_ids):
+            rows.append([rlong(image_id), rint(index), rlong(lc_id),
+                         rint(len(lc_ids))])
+    return _page(rows, params)
+
+
+@shape(r"^select lc from logicalchannel lc where lc\.id in \(:ids\)$")
+def _logicalChannels(store, match, values, params):
+    lc_ids = sorted(set(lc_id for lc_id in values["ids"]
+                        if lc_id in store.lcs))
+    return [store.lcObject(lc_id) for lc_id in _page(lc_ids, params)]
+
+
+@shape(r"^select distinct link\.child\.id from (screenplate|projectdataset"
+       r"|datasetimage)link link where link\.parent\.id in \(:ids\)"
+       r"( and link\.child\.id > :last)? order by link\.child\.id$")
+def _linkChildIds(store, match, values, params):
+    key = ("child", match.group(1), tuple(values["ids"]))
+    child_ids = store.cached(key, lambda: sorted(set(
+        store.childIds(match.group(1), values["ids"]))))
+    child_ids = _after(child_ids, values.get("last"))
+    return [[rlong(child_id)] for child_id in _page(child_ids, params)]
+
+
+@shape(r"^select count\(distinct (ws\.image\.id|link\.child\.id)\) from"
+       r" (wellsample ws|datasetimagelink link) where \w+\.\w+(\.\w+)?\.id"
+       r" in \(select \w+\.child\.id from (screenplate|projectdataset)link"
+       r" \w+ where \w+\.parent\.id in \(:ids\)\)$")
+def _stagedImageCount(store, match, values, params):
+    root = {"screenplate": "screen", "projectdataset": "project"}[
+        match.group(4)]
+    return [[rlong(len(set(store.imageIds(root, values["ids"]))))]]
+
+
+@shape(r"^select distinct ws\.image\.id from wellsample ws"
+       r" where ws\.well\.plate\.id in \(:ids\)"
+       r" and ws\.image\.id > :last order by ws\.image\.id$")
+def _plateImageIds(store, match, values, params):
+    key = ("image", "plate", tuple(values["ids"]))
+    image_ids = store.cached(key, lambda: sorted(set(
+        store.imageIds("plate", values["ids"]))))
+    image_ids = _after(image_ids, values["last"])
+    return [[rlong(image_id)] for image_id in _page(image_ids, params)]
+
+
+@shape(r"^select distinct i\.id, i\.name from datasetimagelink as link"
+       r" join link\.child as i where link\.parent\.id in \(:ids\)"
+       r" and i\.id > :last order by i\.id$")
+def _datasetImageRows(store, match, values, params):
+    key = ("image", "dataset", tuple(values["ids"]))
+    image_ids = store.cached(key, lambda: sorted(set(
+        store.imageIds("dataset", values["ids"]))))
+    image_ids = _page(_after(image_ids, values["last"]), params)
+    return [[rlong(image_id), rstring(store.images[image_id])]
+            for image_id in image_ids]
+
+
+def _projectDatasetIds(store, values):
+    names = set(values["dnames"])
+    return [dataset_id for dataset_id in sorted(
+        store.childIds("projectdataset", [values["pid"]]))
+        if store.datasets[dataset_id] in names]
+
+
+@shape(r"^select distinct d from project as p .*"
+       r"where p\.id = :pid and d\.name in \(:dnames\) order by d\.id$")
+def _projectDatasets(store, match, values, params):
+    return [store.datasetObject(dataset_id) for dataset_id in _page(
+        _projectDatasetIds(store, values), params)]
+
+
+@shape(r"^select d\.id, d\.name from project as p .*"
+       r"where p\.id = :pid and d\.name in \(:dnames\) order by d\.id$")
+def _projectDatasetRows(store, match, values, params):
+    return [[rlong(dataset_id), rstring(store.datasets[dataset_id])]
+            for dataset_id in _page(
+                _projectDatasetIds(store, values), params)]
+
+
+@shape(r"^select link\.id, link\.parent\.id, link\.child\.id"
+       r" from datasetimagelink as link where link\.parent\.id in \(:ids\)"
+       r" and link\.id > :last order by link\.id$")
+def _datasetLinkRows(store, match, values, params):
+    link_ids = sorted(
+        link_id for dataset_id in set(values["ids"])
+        for link_id in store.dataset_links.get(dataset_id, []))
+    link_ids = _page(_after(link_ids, values["last"]), params)
+    return [[rlong(link_id), rlong(store.di_links[link_id][0]),
+             rlong(store.di_links[link_id][1])] for link_id in link_ids]
+
+
+@shape(r"^select ws from wellsample as ws where"
+       r" ws\.(well\.plate|plateacquisition)\.id in \(:ids\)"
+       r" and ws\.id > :last order by ws\.id$")
+def _wellSamples(store, match, values, params):
+    ids = set(values["ids"])
+    if match.group(1) == "well.plate":
+        sample_ids = sorted(
+            sample_id for plate_id in ids
+            for well_id in store.plate_wells.get(plate_id, [])
+            for sample_id in store.well_samples[well_id])
+    else:
+        sample_ids = sorted(sample_id for acquisition_id in ids
+                            for sample_id in store.acquired.get(
+                                acquisition_id, ()))
+    sample_ids = _page(_after(sample_ids, values["last"]), params)
+    return [store.wellSampleObject(sample_id) for sample_id in sample_ids]
+
+
+@shape(r"^select pa\.id from plateacquisition as pa"
+       r" where pa\.plate\.id = :id and pa\.id > :last order by pa\.id$")
+def _plateAcquisitionIds(store, match, values, params):
+    acquisition_ids = sorted(
+        acquisition_id for acquisition_id, plate_id
+        in store.acquisitions.items() if plate_id == values["id"])
+    acquisition_ids = _page(
+        _after(acquisition_ids, values["last"]), params)
+    return [[rlong(acquisition_id)] for acquisition_id in acquisition_ids]
+
+
+@shape(r"^select p\.id from plate as p where p\.id = :id$")
+def _plateId(store, match, values, params):
+    if values["id"] in store.plates:
+        return [[rlong(values["id"])]]
+    return []
+
+
+@shape(r"^select w\.id, w\.row, w\.column, p\.name from well as w"
+       r" join w\.plate as p where p\.id (= :id|in \(select l\.child\.id"
+       r" from screenplatelink as l where l\.parent\.id = :id\))"
+       r" and w\.id > :last order by w\.id$")
+def _wellPositions(store, match, values, params):
+    if match.group(1) == "= :id":
+        plate_ids = [values["id"]]
+    else:
+        plate_ids = store.screen_plates.get(values["id"], [])
+    well_ids = _after(sorted(
+        well_id for plate_id in plate_ids
+        for well_id in store.plate_wells.get(plate_id, [])),
+        values["last"])
+    rows = []
+    for well_id in _page(well_ids, params):
+        plate_id, row, column = store.wells[well_id]
+        rows.append([rlong(well_id), rint(row), rint(column),
+                     rstring(store.plates[plate_id])])
+    return rows
+
+
+@shape(r"^select distinct ws\.well\.id from wellsample as ws"
+       r" where ws\.well\.plate\.id = :id and ws\.well\.id > :last"
+       r" order by ws\.well\.id$")
+def _plateWellIds(store, match, values, params):
+    well_ids = sorted(well_id for well_id
+                      in store.plate_wells.get(values["id"], [])
+                      if store.well_samples[well_id])
+    well_ids = _page(_after(well_ids, values["last"]), params)
+    return [[rlong(well_id)] for well_id in well_ids]
+
+
+@shape(r"^select distinct w from well as w left join fetch w\.wellsamples"
+       r" where w\.id in \(:ids\)$")
+def _wells(store, match, values, params):
+    well_ids = sorted(set(well_id for well_id in values["ids"]
+                          if well_id in store.wells))
+    return [store.wellObject(well_id) for well_id in _page(well_ids, params)]
+
+
+@shape(r"^select p from plate as p left join fetch p\.wells as w"
+       r" left join fetch w\.wellsamples as ws where p\.id = :id$")
+def _plateGraph(store, match, values, params):
+    if values["id"] not in store.plates:
+        return []
+    return [store.plateObject(values["id"])]
+
+
+class UpdateService(object):
+    """
+    Update service writing saved objects back into the Store. New objects
+    get their ids assigned in place and are returned as they are.
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def saveObject(self, obj, ctx=None):
+        self.server.call(
+            "update.saveObject", lambda: self.save([obj]) and None, 1)
+
+    def saveAndReturnObject(self, obj, ctx=None):
+        return self.server.call(
+            "update.saveAndReturnObject", lambda: self.save([obj])[0], 1)
+
+    def saveArray(self, objs, ctx=None):
+        self.server.call(
+            "update.saveArray", lambda: self.save(objs) and None, len(objs))
+
+    def saveAndReturnArray(self, objs, ctx=None):
+        return self.server.call(
+            "update.saveAndReturnArray", lambda: self.save(objs), len(objs))
+
+    def save(self, objs):
+        """
+        Write objs back into the Store. Renames and WellSample updates
+        leave the cached id lists valid, anything else invalidates them.
+        """
+        store = self.server.store
+        structural = False
+        for obj in objs:
+            name = type(obj).__name__
+            saver = getattr(self, "save%s" % name, None)
+            if saver is None:
+                raise omero.ApiUsageException(
+                    "fakeserver cannot save %s" % name)
+            saver(store, obj)
+            structural = structural or name not in (
+                "LogicalChannelI", "WellSampleI", "FileAnnotationI")
+        if structural:
+            store.changed()
+        return list(objs)
+
+    def saveLogicalChannelI(self, store, lc):
+        store.lcs[lc.id.val][0] = lc.name.val
+
+    def saveDatasetImageLinkI(self, store, link):
+        if link.id is None:
+            link.setId(store.linkImage(link.parent.id.val, link.child.id.val))
+
+    def saveDatasetI(self, store, dataset):
+        if dataset.id is None:
+            dataset.setId(store.addDataset(dataset.name.val))
+        elif dataset.isLoaded() and dataset.name is not None:
+            store.datasets[dataset.id.val] = dataset.name.val
+        if dataset.isLoaded():
+            for link in dataset._imageLinks:
+                self.saveDatasetImageLinkI(store, link)
+
+    def saveProjectDatasetLinkI(self, store, link):
+        self.saveDatasetI(store, link.child)
+        if link.id is None:
+            link.setId(store.linkDataset(
+                link.parent.id.val, link.child.id.val))
+
+    def savePlateAcquisitionI(self, store, acquisition):
+        if acquisition.id is None:
+            acquisition.setId(store.addAcquisition(acquisition.plate.id.val))
+
+    def saveWellSampleI(self, store, sample):
+        acquisition = sample.plateAcquisition
+        store.setAcquisition(
+            sample.id.val,
+            acquisition.id.val if acquisition is not None else None)
+
+    def saveWellI(self, store, well):
+        if well._wellSamplesCleared:
+            for sample_id in list(store.well_samples[well.id.val]):
+                store.removeWellSample(sample_id)
+            well._wellSamplesCleared = False
+        for sample in well._wellSamples:
+            self.saveWellSampleI(store, sample)
+
+    def saveFileAnnotationI(self, store, annotation):
+        if annotation.id is None:
+            annotation.setId(store.newId())
+        store.file_annotations[annotation.id.val] = (
+            annotation.file.id.val, annotation.ns and annotation.ns.val)
+
+    def savePlateI(self, store, plate):
+        for well in plate._wells:
+            self.saveWellI(store, well)
+
+
+class Session(object):
+
+    def __init__(self, server):
+        self.server = server
+        self.uuid = str(uuid.uuid4())
+        self.query_service = QueryService(server)
+        self.update_service = UpdateService(server)
+
+    def getQueryService(self):
+        return self.query_service
+
+    def getUpdateService(self):
+        return self.update_service
+
+    def deleteObjects(self, obj_type, obj_ids):
+        def delete():
+            if obj_type != "PlateAcquisition":
+                raise omero.ApiUsageException(
+                    "fakeserver cannot delete %s" % obj_type)
+            for obj_id in obj_ids:
+                self.server.store.removeAcquisition(obj_id)
+            self.server.store.changed()
+        self.server.call("delete.%s" % obj_type, delete, len(obj_ids))
+
+    def close(self):
+        pass
+
+
+class Server(object):
+    """
+    The shared state of the fake: a Store, the configured round-trip
+    latency in seconds, the script inputs handed to scripts.client and
+    the outputs it set, and per method call and payload counters.
+    """
+
+    def __init__(self, store=None, latency=0.0):
+        self.store = store if store is not None else Store()
+        self.latency = latency
+        self.script_inputs = {}
+        self.outputs = {}
+        self.lock = threading.RLock()
+        self.resetStats()
+
+    def resetStats(self):
+        self.calls = Counter()
+        self.objects = Counter()
+
+    def roundTrips(self):
+        return sum(self.calls.values())
+
+    def createSession(self):
+        return Session(self)
+
+    def call(self, method, function, sent=None):
+        """
+        Run one service call: sleep for the latency outside of the lock,
+        so that concurrent sessions overlap their waits like they would
+        against a real server, then run function against the Store. The
+        payload is sent objects for writes and the result otherwise.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            result = function()
+            self.calls[method] += 1
+            if sent is not None:
+                self.objects[method] += sent
+            elif isinstance(result, list):
+                self.objects[method] += len(result)
+            elif result is not None:
+                self.objects[method] += 1
+        return result
@@ -0,0 +1,27 @@
+# coding=utf-8
+"""
+In-memory stand-in for the parts of the OMERO Python API the scripts in
+this repository use. Put the parent directory first on sys.path to run a
+script against fakeserver instead of a live server.
+"""
+
+from __future__ import absolute_import
+
+
+class ServerError(Exception):
+    pass
+
+
+class ApiUsageException(ServerError):
+    pass
+
+
+class UnloadedEntityException(ServerError):
+    pass
+
+
+from omero import rtypes  # noqa: E402
+from omero import sys  # noqa: E402
+from omero import model  # noqa: E402
+
+assert rtypes and sys and model
@@ -0,0 +1,4 @@
+# coding=utf-8
+"""
+Stand-in for omero.clients, imported by the scripts for its side effects.
+"""
@@ -0,0 +1,55 @@
+# coding=utf-8
+"""
+Stand-in for omero.gateway.BlitzGateway on top of a fakeserver session.
+"""
+
+from __future__ import absolute_import
+
+FAKE_USER_ID = 2
+
+
+class BlitzObjectWrapper(object):
+
+    def __init__(self, conn, obj):
+        self._conn = conn
+        self._obj = obj
+
+    def getId(self):
+        return self._obj.id.val
+
+    def getName(self):
+        return self._obj.name and self._obj.name.val
+
+    def __getattr__(self, name):
+        return getattr(self._obj, name)
+
+
+class BlitzGateway(object):
+
+    def __init__(self, client_obj=None, **kwargs):
+        self.c = client_obj
+        self.SERVICE_OPTS = {}
+
+    def _session(self):
+        return self.c.getSession()
+
+    def getUserId(self):
+        return FAKE_USER_ID
+
+    def getQueryService(self):
+        return self._session().getQueryService()
+
+    def getUpdateService(self):
+        return self._session().getUpdateService()
+
+    def getObject(self, obj_type, oid=None, **kwargs):
+        obj = self.getQueryService().find(obj_type, oid, self.SERVICE_OPTS)
+        if obj is None:
+            return None
+        return BlitzObjectWrapper(self, obj)
+
+    def deleteObjects(self, obj_type, obj_ids, wait=False, **kwargs):
+        self._session().deleteObjects(obj_type, list(obj_ids))
+
+    def close(self):
+        pass
@@ -0,0 +1,266 @@
+# coding=utf-8
+"""
+Stand-in for omero.model. Objects are plain containers: the fake services
+build them from the store when answering queries and read them back when
+they are saved. Only the accessors used by the scripts are provided.
+"""
+
+from __future__ import absolute_import
+
+from omero import UnloadedEntityException
+from omero.rtypes import RType, rlong
+
+
+class IObject(object):
+
+    def __init__(self, id=None, loaded=True):
+        if isinstance(id, RType):
+            id = id.val
+        self.id = rlong(id)
+        self._loaded = loaded
+
+    def getId(self):
+        return self.id
+
+    def setId(self, id):
+        self.id = rlong(id)
+
+    def isLoaded(self):
+        return self._loaded
+
+    def unload(self):
+        self._loaded = False
+
+    def proxy(self):
+        return type(self)(self.id, False)
+
+    def errorIfUnloaded(self):
+        if not self._loaded:
+            raise UnloadedEntityException(
+                "Object unloaded:%s:%s" % (type(self).__name__, self.id))
+
+    def __repr__(self):
+        return "%s(%s%s)" % (
+            type(self).__name__, self.id and self.id.val,
+            "" if self._loaded else ", unloaded")
+
+
+class _Named(IObject):
+
+    def __init__(self, id=None, loaded=True):
+        super(_Named, self).__init__(id, loaded)
+        self.name = None
+
+    def getName(self):
+        self.errorIfUnloaded()
+        return self.name
+
+    def setName(self, name):
+        self.errorIfUnloaded()
+        self.name = name
+
+
+class ProjectI(_Named):
+    pass
+
+
+class ScreenI(_Named):
+    pass
+
+
+class DatasetI(_Named):
+
+    def __init__(self, id=None, loaded=True):
+        super(DatasetI, self).__init__(id, loaded)
+        self._imageLinks = []
+
+    def copyImageLinks(self):
+        self.errorIfUnloaded()
+        return list(self._imageLinks)
+
+    def linkedImageList(self):
+        self.errorIfUnloaded()
+        return [link.child for link in self._imageLinks]
+
+    def linkImage(self, image):
+        self.errorIfUnloaded()
+        link = DatasetImageLinkI()
+        link.parent = self
+        link.child = image
+        self._imageLinks.append(link)
+        return link
+
+
+class _Link(IObject):
+
+    def __init__(self, id=None, loaded=True):
+        super(_Link, self).__init__(id, loaded)
+        self.parent = None
+        self.child = None
+
+    def getParent(self):
+        return self.parent
+
+    def setParent(self, parent):
+        self.parent = parent
+
+    def getChild(self):
+        return self.child
+
+    def setChild(self, child):
+        self.child = child
+
+
+class DatasetImageLinkI(_Link):
+    pass
+
+
+class ProjectDatasetLinkI(_Link):
+    pass
+
+
+class ScreenPlateLinkI(_Link):
+    pass
+
+
+class PlateI(_Named):
+
+    def __init__(self, id=None, loaded=True):
+        super(PlateI, self).__init__(id, loaded)
+        self._wells = []
+
+    def copyWells(self):
+        self.errorIfUnloaded()
+        return list(self._wells)
+
+    def sizeOfWells(self):
+        return len(self._wells)
+
+
+class WellI(IObject):
+
+    def __init__(self, id=None, loaded=True):
+        super(WellI, self).__init__(id, loaded)
+        self.row = None
+        self.column = None
+        self.plate = None
+        self._wellSamples = []
+        self._wellSamplesCleared = False
+
+    def copyWellSamples(self):
+        self.errorIfUnloaded()
+        return list(self._wellSamples)
+
+    def sizeOfWellSamples(self):
+        self.errorIfUnloaded()
+        return len(self._wellSamples)
+
+    def clearWellSamples(self):
+        self.errorIfUnloaded()
+        self._wellSamples = []
+        self._wellSamplesCleared = True
+
+
+class WellSampleI(IObject):
+
+    def __init__(self, id=None, loaded=True):
+        super(WellSampleI, self).__init__(id, loaded)
+        self.well = None
+        self.image = None
+        self.plateAcquisition = None
+
+    def getImage(self):
+        return self.image
+
+    def getWell(self):
+        return self.well
+
+    def getPlateAcquisition(self):
+        return self.plateAcquisition
+
+    def setPlateAcquisition(self, plateAcquisition):
+        self.errorIfUnloaded()
+        self.plateAcquisition = plateAcquisition
+
+
+class PlateAcquisitionI(_Named):
+
+    def __init__(self, id=None, loaded=True):
+        super(PlateAcquisitionI, self).__init__(id, loaded)
+        self.plate = None
+
+    def getPlate(self):
+        return self.plate
+
+    def setPlate(self, plate):
+        self.errorIfUnloaded()
+        self.plate = plate
+
+
+class ImageI(_Named):
+
+    def __init__(self, id=None, loaded=True):
+        super(ImageI, self).__init__(id, loaded)
+        self._pixels = []
+
+    def getPrimaryPixels(self):
+        self.errorIfUnloaded()
+        return self._pixels[0]
+
+    def copyPixels(self):
+        return list(self._pixels)
+
+
+class PixelsI(IObject):
+
+    def __init__(self, id=None, loaded=True):
+        super(PixelsI, self).__init__(id, loaded)
+        self.sizeC = None
+        self._channels = []
+
+    def getSizeC(self):
+        return self.sizeC
+
+    def getChannel(self, index):
+        self.errorIfUnloaded()
+        return self._channels[index]
+
+    def copyChannels(self):
+        return list(self._channels)
+
+
+class ChannelI(IObject):
+
+    def __init__(self, id=None, loaded=True):
+        super(ChannelI, self).__init__(id, loaded)
+        self.logicalChannel = None
+
+    def getLogicalChannel(self):
+        return self.logicalChannel
+
+
+class LogicalChannelI(_Named):
+    pass
+
+
+class OriginalFileI(_Named):
+    pass
+
+
+class FileAnnotationI(IObject):
+
+    def __init__(self, id=None, loaded=True):
+        super(FileAnnotationI, self).__init__(id, loaded)
+        self.file = None
+        self.ns = None
+
+    def getFile(self):
+        return self.file
+
+    def setFile(self, file):
+        self.errorIfUnloaded()
+        self.file = file
+
+    def setNs(self, ns):
+        self.errorIfUnloaded()
+        self.ns = ns
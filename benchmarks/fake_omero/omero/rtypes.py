@@ -0,0 +1,155 @@
+# coding=utf-8
+"""
+Stand-in for omero.rtypes: thin value wrappers exposing val, _val and
+getValue() like the Ice generated classes.
+"""
+
+from __future__ import absolute_import
+
+import numbers
+
+
+class RType(object):
+
+    __slots__ = ("_val",)
+
+    def __init__(self, val):
+        self._val = val
+
+    @property
+    def val(self):
+        return self._val
+
+    def getValue(self):
+        return self._val
+
+    def __eq__(self, other):
+        return isinstance(other, RType) and self._val == other._val
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self._val)
+
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self._val)
+
+
+class RLong(RType):
+    __slots__ = ()
+
+
+class RInt(RType):
+    __slots__ = ()
+
+
+class RDouble(RType):
+    __slots__ = ()
+
+
+class RString(RType):
+    __slots__ = ()
+
+
+class RBool(RType):
+    __slots__ = ()
+
+
+class RTime(RType):
+    __slots__ = ()
+
+
+class RList(RType):
+    __slots__ = ()
+
+
+class RMap(RType):
+    __slots__ = ()
+
+
+class RObject(RType):
+    __slots__ = ()
+
+
+def _wrap(cls, val):
+    if val is None:
+        return None
+    if isinstance(val, RType):
+        return val
+    return cls(val)
+
+
+def rlong(val):
+    return _wrap(RLong, val)
+
+
+def rint(val):
+    return _wrap(RInt, val)
+
+
+def rdouble(val):
+    return _wrap(RDouble, val)
+
+
+def rstring(val):
+    return _wrap(RString, val)
+
+
+def rbool(val):
+    return _wrap(RBool, val)
+
+
+def rtime(val):
+    return _wrap(RTime, val)
+
+
+def robject(val):
+    return _wrap(RObject, val)
+
+
+def rlist(val=None):
+    return RList([rtype(v) for v in (val or [])])
+
+
+def rmap(val=None):
+    return RMap(dict((k, rtype(v)) for k, v in (val or {}).items()))
+
+
+def rtype(val):
+    """
+    Wrap a plain Python value in the matching RType.
+    """
+    if val is None or isinstance(val, RType):
+        return val
+    if isinstance(val, bool):
+        return RBool(val)
+    if isinstance(val, numbers.Integral):
+        return RLong(val)
+    if isinstance(val, numbers.Real):
+        return RDouble(val)
+    if isinstance(val, (list, tuple)):
+        return rlist(val)
+    if isinstance(val, dict):
+        return rmap(val)
+    return RString(val)
+
+
+def wrap(val):
+    """
+    Recursively wrap plain Python values, dicts and lists in RTypes.
+    """
+    return rtype(val)
+
+
+def unwrap(val):
+    """
+    Recursively turn RTypes back into plain Python values.
+    """
+    if isinstance(val, RType):
+        val = val._val
+    if isinstance(val, list):
+        return [unwrap(v) for v in val]
+    if isinstance(val, dict):
+        return dict((k, unwrap(v)) for k, v in val.items())
+    return val
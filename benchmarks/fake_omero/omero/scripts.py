@@ -0,0 +1,130 @@
+# coding=utf-8
+"""
+Stand-in for omero.scripts. Parameter declarations only record their
+name and default; client() takes its inputs from fakeserver, filling in
+the declared defaults like the scripting service does, and stores the
+outputs on the server for the caller to inspect.
+"""
+
+from __future__ import absolute_import
+
+import fakeserver
+
+from omero.model import OriginalFileI
+from omero.rtypes import rstring, rtype
+from omero.rtypes import unwrap as _unwrap
+
+
+class Param(object):
+
+    def __init__(self, name, optional=True, out=False, default=None,
+                 **kwargs):
+        self.name = name
+        self.optional = optional
+        self.out = out
+        self.default = default
+
+    def ofType(self, prototype):
+        return self
+
+
+class String(Param):
+    pass
+
+
+class Int(Param):
+    pass
+
+
+class Long(Param):
+    pass
+
+
+class Float(Param):
+    pass
+
+
+class Bool(Param):
+    pass
+
+
+class List(Param):
+    pass
+
+
+class Map(Param):
+    pass
+
+
+class Object(Param):
+    pass
+
+
+class client(object):
+
+    def __init__(self, name, description=None, *params, **kwargs):
+        self.name = name
+        self.server = fakeserver.current()
+        self.session = self.server.createSession()
+        inputs = {}
+        for param in params:
+            if not param.out and param.default is not None:
+                inputs[param.name] = param.default
+        inputs.update(self.server.script_inputs)
+        self.inputs = dict(
+            (key, rtype(value)) for key, value in inputs.items())
+
+    def getInputKeys(self):
+        return sorted(self.inputs)
+
+    def getInput(self, key, unwrap=False):
+        value = self.inputs.get(key)
+        if unwrap:
+            return _unwrap(value)
+        return value
+
+    def setOutput(self, key, value):
+        self.server.outputs[key] = value
+
+    def getOutput(self, key):
+        return self.server.outputs.get(key)
+
+    def getSession(self):
+        return self.session
+
+    def upload(self, filename, name=None, path=None, type=None):
+        """
+        Store the content of a local file as a new OriginalFile.
+        """
+        with open(filename, "rb") as f:
+            data = f.read()
+        store = self.server.store
+
+        def upload():
+            file_id = store.newId()
+            store.files[file_id] = (name or filename, data)
+            original_file = OriginalFileI(file_id)
+            original_file.setName(rstring(name or filename))
+            return original_file
+        return self.server.call("client.upload", upload, 1)
+
+    def getSessionId(self):
+        return self.session.uuid
+
+    def createClient(self, secure=True):
+        """
+        A client joined to the same server, as used by worker threads.
+        """
+        return _JoinedClient(self.server)
+
+    def closeSession(self):
+        self.session.close()
+
+
+class _JoinedClient(client):
+
+    def __init__(self, server):
+        self.name = None
+        self.server = server
+        self.session = server.createSession()
+        self.inputs = {}
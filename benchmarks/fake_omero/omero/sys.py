@@ -0,0 +1,58 @@
+# coding=utf-8
+"""
+Stand-in for omero.sys: query parameters with named values and paging.
+"""
+
+from __future__ import absolute_import
+
+from omero.rtypes import rlist, rlong, unwrap
+
+
+class Filter(object):
+
+    def __init__(self):
+        self.offset = None
+        self.limit = None
+
+
+class ParametersI(object):
+
+    def __init__(self):
+        self.map = {}
+        self.theFilter = None
+
+    def add(self, name, value):
+        self.map[name] = value
+        return self
+
+    def addId(self, id):
+        return self.add("id", rlong(id))
+
+    def addIds(self, ids):
+        return self.add("ids", rlist([rlong(id) for id in ids]))
+
+    def addLong(self, name, value):
+        return self.add(name, rlong(value))
+
+    def addString(self, name, value):
+        return self.add(name, value)
+
+    def page(self, offset, limit):
+        self.theFilter = Filter()
+        self.theFilter.offset = rlong(offset)
+        self.theFilter.limit = rlong(limit)
+        return self
+
+    def values(self):
+        """
+        Named values unwrapped to plain Python values.
+        """
+        return dict((name, unwrap(value)) for name, value in self.map.items())
+
+    def paging(self):
+        """
+        (offset, limit) of the page, limit None when unpaged.
+        """
+        if self.theFilter is None:
+            return 0, None
+        return unwrap(self.theFilter.offset), unwrap(self.theFilter.limit)
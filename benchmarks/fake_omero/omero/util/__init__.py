@@ -0,0 +1,4 @@
+# coding=utf-8
+"""
+Stand-in for omero.util, holding the modules Populate_Metadata imports.
+"""
@@ -0,0 +1,68 @@
+# coding=utf-8
+"""
+Stand-in for omero.util.populate_metadata. ParsingContext keeps the
+columns it parsed and write_to_omero() stores them in the Store under the
+target object, so that callers can compare how a file was parsed. Like
+the current omero-py, parse_from_handle() rejects empty column names and
+keeps only the rows of the target Plate when the file has a Plate column.
+"""
+
+from __future__ import absolute_import
+
+import csv
+
+import fakeserver
+
+
+class HeaderResolver(object):
+
+    def __init__(self, target_object, headers, column_types=None):
+        self.target_object = target_object
+        self.headers = headers
+        self.column_types = column_types
+
+    def create_columns(self):
+        return [[name.strip()] for name in self.headers]
+
+
+class ParsingContext(object):
+
+    def __init__(self, client, target_object, file, column_types=None):
+        self.client = client
+        self.target_object = target_object
+        self.file = file
+        self.column_types = column_types
+        self.columns = []
+
+    def parse_from_handle(self, data):
+        rows = list(csv.reader(data, delimiter=","))
+        header = [name.strip() for name in rows[0]]
+        if "" in header:
+            raise Exception("Empty column name in the header")
+        self.columns = HeaderResolver(
+            self.target_object, header,
+            column_types=self.column_types).create_columns()
+        self.populate(self.subselect(rows[1:], header))
+        self.post_process()
+
+    def subselect(self, rows, header):
+        names = [name.lower() for name in header]
+        if type(self.target_object).__name__ != "PlateI" \
+                or "plate" not in names:
+            return rows
+        plate_name = fakeserver.current().store.plates.get(
+            self.target_object.id.val)
+        column = names.index("plate")
+        return [row for row in rows if row[column] == plate_name]
+
+    def populate(self, rows):
+        for row in rows:
+            for column, value in zip(self.columns, row):
+                column.append(value)
+
+    def post_process(self):
+        pass
+
+    def write_to_omero(self):
+        store = fakeserver.current().store
+        store.tables[self.target_object.id.val] = self.columns
@@ -0,0 +1,23 @@
+# coding=utf-8
+"""
+Stand-in for omero.util.populate_roi.
+"""
+
+from __future__ import absolute_import
+
+import io
+
+import fakeserver
+
+
+class DownloadingOriginalFileProvider(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get_original_file_data(self, original_file):
+        """
+        A text handle on the content of an OriginalFile of the Store.
+        """
+        name, data = fakeserver.current().store.files[original_file.id.val]
+        return io.StringIO(data.decode("utf-8"))
@@ -0,0 +1,4 @@
+# coding=utf-8
+"""
+Stand-in for the omero-metadata package.
+"""
@@ -0,0 +1,54 @@
+# coding=utf-8
+"""
+Stand-in for omero_metadata.populate. Its ParsingContext streams: the
+columns come from preprocess_from_handle(), which must run first, and
+parse_from_handle_stream() writes the rows to the Store batch_size at a
+time, recording the size of every batch written.
+"""
+
+from __future__ import absolute_import
+
+import csv
+
+import fakeserver
+from omero.util.populate_metadata import HeaderResolver
+
+
+class ParsingContext(object):
+
+    def __init__(self, client, target_object, file=None, batch_size=1000):
+        self.client = client
+        self.target_object = target_object
+        self.file = file
+        self.batch_size = batch_size
+        self.columns = None
+        self.batches = []
+
+    def preprocess_from_handle(self, data):
+        reader = csv.reader(data, delimiter=",")
+        self.columns = HeaderResolver(
+            self.target_object, next(reader)).create_columns()
+        for row in reader:
+            pass
+
+    def parse_from_handle_stream(self, data):
+        if self.columns is None:
+            raise ValueError("preprocess_from_handle() must run first")
+        reader = csv.reader(data, delimiter=",")
+        next(reader)
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+
+    def write_batch(self, batch):
+        for row in batch:
+            for column, value in zip(self.columns, row):
+                column.append(value)
+        self.batches.append(len(batch))
+        store = fakeserver.current().store
+        store.tables[self.target_object.id.val] = self.columns
@@ -0,0 +1,352 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Scaling benchmarks of the scripts against the in-memory server in
+fake_omero. This is a development tool, not an OMERO script: run it with
+a plain Python interpreter from a checkout,
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 \\
+        --latency 0.001 --json results.json
+
+Every scenario runs on a freshly populated store. Wall time and round
+trips come from an untraced run, peak memory from a second run under
+tracemalloc (skipped with --no-memory and on Python 2). Each scenario
+checks the store afterwards, so a benchmark that stops doing its work
+fails instead of getting faster. With --baseline the results are compared
+to an earlier --json file: more round trips than the baseline, or wall
+time or peak memory beyond --tolerance, is reported as a regression and
+the exit status is 1.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPOSITORY_DIR)
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "fake_omero"))
+
+import fakeserver  # noqa: E402
+from omero.gateway import BlitzGateway  # noqa: E402
+import omero.scripts as scripts  # noqa: E402
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+timer = getattr(time, "perf_counter", time.time)
+
+CHANNEL_NAMES = ["DAPI", "GFP", "Cy5"]
+
+
+RENAME = "util_scripts/Change_Channel_Names.py"
+COPY = "util_scripts/Copy_Full_Res_Images.py"
+PLATE_ACQUISITIONS = "hcs_scripts/Manage_Plate_Acquisitions.py"
+UNLINK = "hcs_scripts/Unlink_Images.py"
+
+
+def loadScript(path):
+    """
+    Import a script by path without running its __main__ block.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    path = os.path.join(REPOSITORY_DIR, path)
+    try:
+        import importlib.util
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+
+
+def scriptConnection():
+    """
+    A BlitzGateway on a new client of the installed server, built the
+    way the scripts build theirs.
+    """
+    return BlitzGateway(client_obj=scripts.client("benchmark"))
+
+
+def runScript(server, module, inputs, entry="run"):
+    server.script_inputs = inputs
+    getattr(module, entry)()
+    return server.outputs.get("Message")
+
+
+def checkChannels(store, roots):
+    return all(lc[0] in CHANNEL_NAMES for lc in store.lcs.values())
+
+
+def checkCopied(store, roots):
+    linked = sum(len(store.datasetImageIds(dataset_id))
+                 for dataset_id in store.childIds(
+                     "projectdataset", [roots["target_project"]]))
+    return linked == len(store.images)
+
+
+def checkAcquired(store, roots):
+    return all(sample[2] is not None for sample in store.samples.values())
+
+
+def checkReleased(store, roots):
+    return not store.acquisitions and \
+        len(store.samples) == len(store.images)
+
+
+def checkUnlinked(store, roots):
+    return not store.samples
+
+
+def addAcquisitions(store, roots):
+    for plate_id in roots["plates"]:
+        acquisition_id = store.addAcquisition(plate_id)
+        for well_id in store.plate_wells[plate_id]:
+            for sample_id in store.well_samples[well_id]:
+                store.setAcquisition(sample_id, acquisition_id)
+    store.changed()
+
+
+def renameChannels(data_type, **extra):
+    def run(module, server, roots):
+        ids = {"Screen": [roots["screen"]], "Plate": roots["plates"],
+               "Dataset": [roots["source_dataset"]]}[data_type]
+        params = {"Data_Type": data_type, "IDs": ids,
+                  "New_Channel_Names": CHANNEL_NAMES}
+        params.update(extra)
+        if params.get("Workers", 1) > 1:
+            return runScript(server, module, params, "runAsScript")
+        return module.renameChannels(scriptConnection(), params).run()
+    return run
+
+
+def copyImages(**extra):
+    def run(module, server, roots):
+        params = {"Project_ID": roots["target_project"],
+                  "IDs": [roots["source_dataset"]],
+                  "Regex_String": r"^(\w+-\w+)-.*"}
+        params.update(extra)
+        return module.copyHighResImages(scriptConnection(), params).run()
+    return run
+
+
+def managePlateAcquisitions(mode, **extra):
+    def run(module, server, roots):
+        params = {"IDs": roots["plates"], "Mode": mode}
+        params.update(extra)
+        return runScript(server, module, params)
+    return run
+
+
+def unlinkImages(**extra):
+    def run(module, server, roots):
+        params = {"IDs": roots["plates"]}
+        params.update(extra)
+        return runScript(server, module, params)
+    return run
+
+
+# (name, script, run, check, setup)
+SCENARIOS = [
+    ("rename_screen", RENAME, renameChannels("Screen"), checkChannels, None),
+    ("rename_plate", RENAME, renameChannels("Plate"), checkChannels, None),
+    ("rename_dataset", RENAME, renameChannels("Dataset"), checkChannels,
+     None),
+    ("rename_screen_id_only", RENAME,
+     renameChannels("Screen", Id_Only=True), checkChannels, None),
+    ("rename_screen_workers", RENAME,
+     renameChannels("Screen", Workers=4), checkChannels, None),
+    ("rename_screen_prefetch", RENAME,
+     renameChannels("Screen", Prefetch=True), checkChannels, None),
+    ("copy", COPY, copyImages(), checkCopied, None),
+    ("copy_link_only", COPY, copyImages(Link_Only=True), checkCopied, None),
+    ("copy_link_only_prefetch", COPY,
+     copyImages(Link_Only=True, Prefetch=True), checkCopied, None),
+    ("plate_acquisitions_add", PLATE_ACQUISITIONS,
+     managePlateAcquisitions("Add"), checkAcquired, None),
+    ("plate_acquisitions_remove", PLATE_ACQUISITIONS,
+     managePlateAcquisitions("Remove"), checkReleased, addAcquisitions),
+    ("unlink", UNLINK, unlinkImages(), checkUnlinked, None),
+    ("unlink_streaming", UNLINK, unlinkImages(Streaming=True),
+     checkUnlinked, None),
+]
+
+
+class quietOutput(object):
+    """
+    Send the scripts' progress printing to os.devnull.
+    """
+
+    def __enter__(self):
+        self.stdout = sys.stdout
+        self.devnull = open(os.devnull, "w")
+        sys.stdout = self.devnull
+
+    def __exit__(self, *args):
+        sys.stdout = self.stdout
+        self.devnull.close()
+
+
+def prepare(images, latency, setup):
+    store = fakeserver.Store()
+    roots = fakeserver.populate(store, images)
+    if setup is not None:
+        setup(store, roots)
+    server = fakeserver.install(fakeserver.Server(store, latency))
+    return server, roots
+
+
+def runScenario(name, module, run, check, setup, images, latency, memory):
+    """
+    Run one scenario on images images, the script module already loaded
+    so that importing it is not measured.
+    """
+    server, roots = prepare(images, latency, setup)
+    start = timer()
+    with quietOutput():
+        message = run(module, server, roots)
+    seconds = timer() - start
+    result = {
+        "scenario": name, "images": images, "latency": latency,
+        "seconds": round(seconds, 4),
+        "round_trips": server.roundTrips(),
+        "calls": dict(server.calls), "objects": dict(server.objects),
+        "peak_kb": None, "ok": bool(check(server.store, roots)),
+        "message": getattr(message, "val", message),
+    }
+    if memory and tracemalloc is not None:
+        server, roots = prepare(images, latency, setup)
+        tracemalloc.start()
+        try:
+            with quietOutput():
+                run(module, server, roots)
+            result["peak_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regressions of results against the baseline results, as messages.
+    """
+    previous = dict(((r["scenario"], r["images"]), r) for r in baseline)
+    regressions = []
+    for result in results:
+        key = (result["scenario"], result["images"])
+        if not result["ok"]:
+            regressions.append("%s@%d: check failed" % key)
+        if key not in previous:
+            continue
+        before = previous[key]
+        if result["round_trips"] > before["round_trips"]:
+            regressions.append("%s@%d: round trips %d -> %d" % (
+                key + (before["round_trips"], result["round_trips"])))
+        for field in ("seconds", "peak_kb"):
+            if not before.get(field) or result[field] is None:
+                continue
+            if result[field] > before[field] * (1 + tolerance):
+                regressions.append("%s@%d: %s %s -> %s" % (
+                    key + (field, before[field], result[field])))
+    return regressions
+
+
+def printTable(results):
+    header = ("scenario", "images", "seconds", "round trips", "peak KiB",
+              "check")
+    print("%-28s %8s %10s %12s %10s %6s" % header)
+    for r in results:
+        print("%-28s %8d %10.3f %12d %10s %6s" % (
+            r["scenario"], r["images"], r["seconds"], r["round_trips"],
+            "-" if r["peak_kb"] is None else r["peak_kb"],
+            "ok" if r["ok"] else "FAIL"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Scaling benchmarks against an in-memory OMERO server")
+    parser.add_argument(
+        "--sizes", default="1000,10000,100000",
+        help="comma separated numbers of images")
+    parser.add_argument(
+        "--latency", type=float, default=0.0,
+        help="seconds added to every round trip")
+    parser.add_argument(
+        "--scenarios", default=None,
+        help="comma separated scenario names, all by default: %s" % (
+            ", ".join(s[0] for s in SCENARIOS)))
+    parser.add_argument(
+        "--no-memory", action="store_true",
+        help="skip the tracemalloc run measuring peak memory")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument(
+        "--baseline", help="results file of an earlier run to compare to")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25,
+        help="allowed relative increase of wall time and peak memory")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    scenarios = SCENARIOS
+    if args.scenarios:
+        names = args.scenarios.split(",")
+        unknown = set(names) - set(s[0] for s in SCENARIOS)
+        if unknown:
+            parser.error("unknown scenarios: %s" % ", ".join(sorted(unknown)))
+        scenarios = [s for s in SCENARIOS if s[0] in names]
+
+    modules = dict((script, loadScript(script))
+                   for script in set(s[1] for s in scenarios))
+    results = []
+    for images in sizes:
+        for name, script, run, check, setup in scenarios:
+            results.append(runScenario(
+                name, modules[script], run, check, setup, images,
+                args.latency, not args.no_memory))
+            sys.stderr.write("%s@%d done\n" % (name, images))
+    printTable(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"python": sys.version.split()[0],
+                       "latency": args.latency, "results": results},
+                      f, indent=1, sort_keys=True)
+
+    baseline = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
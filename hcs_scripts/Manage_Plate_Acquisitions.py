@@ -37,8 +37,178 @@ from omero.sys import ParametersI
 
 import omero.scripts as scripts
 
+from multiprocessing.pool import ThreadPool
+
+from omero_script_utils.instrumentation import ServiceTimer
+from omero_script_utils.paging import keysetPages
+
 assert omero
 
+BATCH_SIZE = 1000
+
+
+def iterWellSampleBatches(queryService, condition, ids, batchSize,
+                          ctx=None):
+    """
+    Keyset page through the WellSamples matching condition, loading only
+    the flat WellSample rows, batchSize at a time.
+
+    @param condition: HQL restriction on "ws" using the :ids parameter.
+    """
+    queryString = """
+        SELECT ws FROM WellSample AS ws
+            WHERE %s AND ws.id > :last
+            ORDER BY ws.id
+        """ % condition
+    params = ParametersI()
+    params.addIds(ids)
+    return keysetPages(queryService, queryString, params, batchSize,
+                       ctx=ctx, method="findAllByQuery")
+
+
+def addPlateAcquisition(queryService, updateService, plateId, batchSize,
+                        ctx=None):
+    """
+    Create a PlateAcquisition for a Plate and move all of its WellSamples
+    to it, saving one batch of WellSamples at a time.
+    """
+    plateAcquisitionObj = PlateAcquisitionI()
+    plateAcquisitionObj.setPlate(PlateI(plateId, False))
+    plateAcquisitionObj = updateService.saveAndReturnObject(
+        plateAcquisitionObj)
+    plateAcquisitionId = plateAcquisitionObj.getId()._val
+
+    for wellSampleList in iterWellSampleBatches(
+            queryService, "ws.well.plate.id IN (:ids)", [plateId],
+            batchSize, ctx):
+        for wellSample in wellSampleList:
+            wellSample.setPlateAcquisition(
+                PlateAcquisitionI(plateAcquisitionId, False))
+        updateService.saveArray(wellSampleList)
+    return plateAcquisitionId
+
+
+def getPlateAcquisitionIds(queryService, plateId, ctx=None):
+    params = ParametersI()
+    params.addId(plateId)
+    return [row[0]._val for rows in keysetPages(
+        queryService,
+        "SELECT pa.id FROM PlateAcquisition AS pa"
+        " WHERE pa.plate.id = :id AND pa.id > :last ORDER BY pa.id",
+        params, BATCH_SIZE, ctx=ctx) for row in rows]
+
+
+def detachWellSamples(connection, plateAcquisitionIds, batchSize):
+    """
+    Detach every WellSample from the PlateAcquisitions once, batchSize
+    WellSamples per save, so that the PlateAcquisitions can be deleted.
+    """
+    queryService = connection.getQueryService()
+    updateService = connection.getUpdateService()
+    for wellSampleList in iterWellSampleBatches(
+            queryService, "ws.plateAcquisition.id IN (:ids)",
+            plateAcquisitionIds, batchSize, connection.SERVICE_OPTS):
+        for wellSample in wellSampleList:
+            wellSample.setPlateAcquisition(None)
+        updateService.saveArray(wellSampleList)
+
+
+def processPlate(connection, plateId, mode, timing):
+    """
+    Add a PlateAcquisition to a single Plate, or detach the WellSamples
+    of all of its PlateAcquisitions, on the given connection. Returns
+    (error, message, ids of the PlateAcquisitions left to delete); the
+    message is None until those are deleted.
+    """
+    with timing.phase("lookup"):
+        plateObj = connection.getObject("Plate", plateId)
+    if plateObj is None:
+        return True, "ERROR: No Plate with ID %s." % plateId, []
+    if mode == "Add":
+        with timing.phase("add"):
+            plateAcquisitionId = addPlateAcquisition(
+                connection.getQueryService(), connection.getUpdateService(),
+                plateId, BATCH_SIZE, connection.SERVICE_OPTS)
+        return False, "Linked new PlateAcquisition with ID %d" \
+            " to Plate with ID %d." % (plateAcquisitionId, plateId), []
+    with timing.phase("lookup"):
+        plateAcquisitionIds = getPlateAcquisitionIds(
+            connection.getQueryService(), plateId, connection.SERVICE_OPTS)
+    if not plateAcquisitionIds:
+        return False, \
+            "No PlateAcquisitions in Plate with ID %d." % plateId, []
+    with timing.phase("detach"):
+        detachWellSamples(connection, plateAcquisitionIds, BATCH_SIZE)
+    return False, None, plateAcquisitionIds
+
+
+def tryProcessPlate(connection, plateId, mode, timing):
+    """
+    Run processPlate, turning failures into an error message for that
+    Plate so that the other Plates are still processed.
+    """
+    try:
+        return processPlate(connection, plateId, mode, timing)
+    except Exception as e:
+        return True, "ERROR: Plate with ID %d failed: %s." % (plateId, e), []
+
+
+def deletePlateAcquisitions(connection, plateIds, results, timing):
+    """
+    Delete the PlateAcquisitions detached from all of the Plates with a
+    single delete request, then report on every Plate. Returns a list of
+    (error, message), one per Plate.
+    """
+    plateAcquisitionIds = [plateAcquisitionId
+                           for error, message, ids in results
+                           for plateAcquisitionId in ids]
+    failure = None
+    if plateAcquisitionIds:
+        try:
+            with timing.phase("delete"):
+                # Waits for the delete, which raises if it fails
+                connection.deleteObjects(
+                    "PlateAcquisition", plateAcquisitionIds, wait=True)
+        except Exception as e:
+            failure = e
+    reported = []
+    for plateId, (error, message, ids) in zip(plateIds, results):
+        if message is None and failure is not None:
+            error, message = True, "ERROR: Deleting the %d" \
+                " PlateAcquisition(s) of Plate with ID %d failed: %s." % (
+                    len(ids), plateId, failure)
+        elif message is None:
+            message = "%d PlateAcquisition(s) removed from Plate with" \
+                " ID %d." % (len(ids), plateId)
+        reported.append((error, message))
+    return reported
+
+
+def processPlateOnWorker(client, plateId, mode, timing):
+    """
+    Run tryProcessPlate on a session joined from the script's session.
+    """
+    workerClient = client.createClient(secure=True)
+    try:
+        return tryProcessPlate(
+            timing.connection(BlitzGateway(client_obj=workerClient)),
+            plateId, mode, timing)
+    finally:
+        workerClient.closeSession()
+
+
+def processPlatesInParallel(client, plateIds, mode, workers, timing):
+    pool = ThreadPool(min(workers, len(plateIds)))
+    try:
+        with timing.phase("workers", waiting=True):
+            return pool.map(
+                lambda plateId: processPlateOnWorker(
+                    client, plateId, mode, timing),
+                plateIds)
+    finally:
+        pool.close()
+        pool.join()
+
 
 def run():
     """
@@ -63,6 +233,16 @@ def run():
                        values=[rstring("Add"), rstring("Remove")],
                        default="Add"),
 
+        scripts.Int("Workers", optional=True, grouping="4",
+                    description="Number of Plates processed concurrently,"
+                                " each on its own session",
+                    default=1, min=1),
+
+        scripts.Bool("Timing_Trace", optional=True, grouping="5",
+                     default=False,
+                     description="Attach a JSON trace of every query and"
+                                 " update call as a file output"),
+
         version="0.2",
         authors=["Niko Klaric"],
         institutions=["Glencoe Software Inc."],
@@ -75,72 +255,34 @@ def run():
             if client.getInput(key):
                 scriptParams[key] = client.getInput(key, unwrap=True)
 
-        connection = BlitzGateway(client_obj=client)
-        updateService = connection.getUpdateService()
-        queryService = connection.getQueryService()
+        timing = ServiceTimer(scriptParams.get("Timing_Trace", False))
+        connection = timing.connection(BlitzGateway(client_obj=client))
 
         processedMessages = []
-
-        for plateId in scriptParams["IDs"]:
-            plateObj = connection.getObject("Plate", plateId)
-            if plateObj is None:
-                client.setOutput(
-                    "Message",
-                    rstring("ERROR: No Plate with ID %s" % plateId))
-                return
-
-            if scriptParams["Mode"] == "Add":
-                plateAcquisitionObj = PlateAcquisitionI()
-                plateAcquisitionObj.setPlate(PlateI(plateObj.getId(), False))
-
-                wellGrid = plateObj.getWellGrid()
-                for axis in wellGrid:
-                    for wellObj in axis:
-                        wellSampleList = wellObj.copyWellSamples()
-                        plateAcquisitionObj.addAllWellSampleSet(wellSampleList)
-
-                plateAcquisitionObj = updateService.saveAndReturnObject(
-                    plateAcquisitionObj)
-                plateAcquisitionId = plateAcquisitionObj.getId()._val
-
-                processedMessages.append(
-                    "Linked new PlateAcquisition with ID %d"
-                    " to Plate with ID %d." % (plateAcquisitionId, plateId))
-            else:
-                params = ParametersI()
-                params.addId(plateId)
-
-                queryString = """
-                    FROM PlateAcquisition AS pa
-                    LEFT JOIN FETCH pa.wellSample
-                    LEFT OUTER JOIN FETCH pa.annotationLinks
-                        WHERE pa.plate.id = :id
-                    """
-                plateAcquisitionList = queryService.findAllByQuery(
-                    queryString, params, connection.SERVICE_OPTS)
-                if plateAcquisitionList:
-                    updateList = []
-
-                    for plate_acquisition in plateAcquisitionList:
-                        for well_sample in plate_acquisition.copyWellSample():
-                            well_sample.setPlateAcquisition(None)
-                            updateList.append(well_sample)
-
-                        updateService.saveArray(updateList)
-
-                        plate_acquisition.clearWellSample()
-                        plate_acquisition.clearAnnotationLinks()
-
-                        plate_acquisition = updateService.saveAndReturnObject(
-                            plate_acquisition)
-                        updateService.deleteObject(plate_acquisition)
-
-                processedMessages.append(
-                    "%d PlateAcquisition(s) removed from Plate with ID %d." %
-                    (len(plateAcquisitionList), plateId))
-
-        client.setOutput("Message", rstring("No errors. %s" %
-                         " ".join(processedMessages)))
+        errors = 0
+
+        workers = scriptParams.get("Workers", 1)
+        if workers > 1 and len(scriptParams["IDs"]) > 1:
+            results = processPlatesInParallel(
+                client, scriptParams["IDs"], scriptParams["Mode"],
+                workers, timing)
+        else:
+            results = [tryProcessPlate(
+                connection, plateId, scriptParams["Mode"], timing)
+                for plateId in scriptParams["IDs"]]
+        results = deletePlateAcquisitions(
+            connection, scriptParams["IDs"], results, timing)
+        for error, message in results:
+            errors += error
+            processedMessages.append(message)
+
+        if errors:
+            summary = "%d Plate(s) failed." % errors
+        else:
+            summary = "No errors."
+        client.setOutput("Message", rstring("%s %s" % (
+            summary, " ".join(processedMessages))))
+        timing.report(client)
     finally:
         client.closeSession()
 
@@ -32,8 +32,128 @@ from omero.sys import ParametersI
 
 import omero.scripts as scripts
 
+from multiprocessing.pool import ThreadPool
+
+from omero_script_utils.instrumentation import ServiceTimer
+from omero_script_utils.paging import keysetPages
+
 assert omero
 
+WELL_BATCH_SIZE = 100
+
+
+def unlink_plate_streaming(session, plate_id, timing,
+                           batch_size=WELL_BATCH_SIZE):
+    """
+    Unlink the Images of a Plate without loading the whole Plate graph:
+    the ids of Wells that still have WellSamples are keyset paged and
+    only batch_size Wells, with their WellSamples, are loaded, cleared
+    and saved at a time. Returns (error, count).
+    """
+    query_service = session.getQueryService()
+    update_service = session.getUpdateService()
+    params = ParametersI()
+    params.addId(plate_id)
+    with timing.phase("page"):
+        found = query_service.projection(
+            "SELECT p.id FROM Plate AS p WHERE p.id = :id", params)
+    if not found:
+        return "No Plate with ID %s" % plate_id, 0
+    count = 0
+    params = ParametersI()
+    params.addId(plate_id)
+    for rows in keysetPages(
+            query_service,
+            "SELECT DISTINCT ws.well.id FROM WellSample AS ws "
+            "WHERE ws.well.plate.id = :id AND ws.well.id > :last "
+            "ORDER BY ws.well.id", params, batch_size,
+            timing=timing, phase="page"):
+        params = ParametersI()
+        params.addIds([row[0].val for row in rows])
+        with timing.phase("load"):
+            wells = query_service.findAllByQuery(
+                "SELECT DISTINCT w FROM Well AS w "
+                "LEFT JOIN FETCH w.wellSamples "
+                "WHERE w.id IN (:ids)", params)
+        batch_count = 0
+        for well in wells:
+            batch_count += well.sizeOfWellSamples()
+            well.clearWellSamples()
+        with timing.phase("save"):
+            update_service.saveArray(wells)
+        count += batch_count
+        print("Plate %s: unlinked %d Image(s) from %d Well(s), %d so far" % (
+            plate_id, batch_count, len(wells), count))
+    return None, count
+
+
+def unlink_plate(session, plate_id, timing):
+    """
+    Unlink all Images of a single Plate. Returns (error, count).
+    """
+    params = ParametersI()
+    params.addId(plate_id)
+    with timing.phase("load"):
+        plate = session.getQueryService().findByQuery(
+            "SELECT p from Plate AS p "
+            "LEFT JOIN FETCH p.wells as w "
+            "LEFT JOIN FETCH w.wellSamples as ws "
+            "WHERE p.id = :id", params)
+    if plate is None:
+        return "No Plate with ID %s" % plate_id, 0
+    count = 0
+    for well in plate.copyWells():
+        count += well.sizeOfWellSamples()
+        well.clearWellSamples()
+    with timing.phase("save"):
+        session.getUpdateService().saveObject(plate)
+    return None, count
+
+
+def unlink_plate_on_worker(client, unlink, plate_id, timing):
+    """
+    Run unlink on a session joined from the script's session.
+    """
+    worker_client = client.createClient(secure=True)
+    try:
+        return unlink(timing.connection(worker_client.getSession()),
+                      plate_id, timing)
+    except Exception as e:
+        return "Plate with ID %s failed: %s" % (plate_id, e), 0
+    finally:
+        worker_client.closeSession()
+
+
+def unlink_plates(client, plate_ids, workers, streaming=False, timing=None):
+    """
+    Unlink the Plates on a pool of at most workers threads, returning
+    (plate_id, error, count) for each of them.
+    """
+    unlink = unlink_plate_streaming if streaming else unlink_plate
+    if timing is None:
+        timing = ServiceTimer()
+    if workers <= 1 or len(plate_ids) <= 1:
+        session = timing.connection(client.getSession())
+        results = []
+        for plate_id in plate_ids:
+            try:
+                error, count = unlink(session, plate_id, timing)
+            except Exception as e:
+                error, count = "Plate with ID %s failed: %s" % (
+                    plate_id, e), 0
+            results.append((plate_id, error, count))
+        return results
+    pool = ThreadPool(min(workers, len(plate_ids)))
+    try:
+        with timing.phase("workers", waiting=True):
+            return pool.map(
+                lambda plate_id: (plate_id,) + unlink_plate_on_worker(
+                    client, unlink, plate_id, timing),
+                plate_ids)
+    finally:
+        pool.close()
+        pool.join()
+
 
 def run():
     """
@@ -52,6 +172,21 @@ def run():
         scripts.List("IDs", optional=False, grouping="2",
                      description="List of Plate IDs").ofType(rlong(0)),
 
+        scripts.Int("Workers", optional=True, grouping="3",
+                    description="Number of Plates unlinked concurrently,"
+                                " each on its own session",
+                    default=1, min=1),
+
+        scripts.Bool("Streaming", optional=True, grouping="4",
+                     description="Unlink Wells in small batches instead of"
+                                 " loading and saving whole Plates",
+                     default=False),
+
+        scripts.Bool("Timing_Trace", optional=True, grouping="5",
+                     default=False,
+                     description="Attach a JSON trace of every query and"
+                                 " update call as a file output"),
+
         version="0.1",
         authors=["Chris Allan"],
         institutions=["Glencoe Software Inc."],
@@ -64,26 +199,19 @@ def run():
             if client.getInput(key):
                 script_params[key] = client.getInput(key, unwrap=True)
 
-        session = client.getSession()
-        update_service = session.getUpdateService()
-        query_service = session.getQueryService()
-
-        count = 0
-        for plate_id in script_params["IDs"]:
-            params = ParametersI()
-            params.addId(plate_id)
-            plate = query_service.findByQuery(
-                "SELECT p from Plate AS p "
-                "LEFT JOIN FETCH p.wells as w "
-                "LEFT JOIN FETCH w.wellSamples as ws "
-                "WHERE p.id = :id", params)
-            for well in plate.copyWells():
-                count += well.sizeOfWellSamples()
-                well.clearWellSamples()
-            update_service.saveObject(plate)
-
-        client.setOutput("Message", rstring(
-            "Unlinking of %d Image(s) successful." % count))
+        timing = ServiceTimer(script_params.get("Timing_Trace", False))
+        results = unlink_plates(
+            client, script_params["IDs"], script_params.get("Workers", 1),
+            script_params.get("Streaming", False), timing)
+        count = sum(result[2] for result in results)
+        errors = [result[1] for result in results if result[1] is not None]
+
+        message = "Unlinking of %d Image(s) successful." % count
+        if errors:
+            message = "%s %d Plate(s) failed: %s." % (
+                message, len(errors), "; ".join(errors))
+        client.setOutput("Message", rstring(message))
+        timing.report(client)
     finally:
         client.closeSession()
 
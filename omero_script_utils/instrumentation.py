@@ -0,0 +1,343 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Instrumentation of the query and update services used by the scripts.
+
+A ServiceTimer hands out wrapped connections whose query and update
+services count the calls per method, their latency as a histogram and
+the number of objects sent and received. Calls are attributed to the
+phase the calling thread is in; the time a phase spends outside of
+service calls is reported as client time. Worker threads sharing the
+ServiceTimer charge their calls and time to their own phases, while the
+thread waiting for them sits in a waiting phase that is left out of the
+service and client split. The summary is set as the
+"Timing" output of the script and can also be uploaded, with every single
+call, as a JSON trace file.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from omero.model import FileAnnotationI, OriginalFileI
+from omero.rtypes import robject, rstring, wrap
+
+timer = getattr(time, "perf_counter", time.time)
+
+# Upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+BUCKET_NAMES = ["<%dms" % bound for bound in LATENCY_BUCKETS_MS] + \
+    [">=%dms" % LATENCY_BUCKETS_MS[-1]]
+
+MAIN_PHASE = "main"
+
+TRACE_NAME = "timing_trace.json"
+
+TRACE_NS = "glencoesoftware.com/omero-user-scripts/timing-trace"
+
+
+def countObjects(value):
+    """
+    Number of model objects or rows in an argument or a result.
+    """
+    if value is None:
+        return 0
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return 1
+
+
+class MethodStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.objects = 0
+        self.histogram = [0] * len(BUCKET_NAMES)
+
+    def add(self, seconds, objects):
+        self.calls += 1
+        self.seconds += seconds
+        self.objects += objects
+        milliseconds = seconds * 1000
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS_MS) \
+                and milliseconds >= LATENCY_BUCKETS_MS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 6),
+            "objects": self.objects,
+            "histogram": dict(
+                (name, count) for name, count
+                in zip(BUCKET_NAMES, self.histogram) if count),
+        }
+
+
+class PhaseStats(object):
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.waiting = False
+        self.methods = OrderedDict()
+
+    def summary(self):
+        if self.waiting:
+            return {"seconds": round(self.seconds, 6), "waiting": True}
+        service_seconds = sum(m.seconds for m in self.methods.values())
+        return {
+            "seconds": round(self.seconds, 6),
+            "service_seconds": round(service_seconds, 6),
+            "client_seconds": round(
+                max(self.seconds - service_seconds, 0.0), 6),
+            "calls": sum(m.calls for m in self.methods.values()),
+            "methods": dict((name, m.summary())
+                            for name, m in self.methods.items()),
+        }
+
+
+def timedCall(serviceTimer, method, function, counted):
+    """
+    Wrap function so that each call is recorded as method. The objects
+    of the first argument count as sent when counted is True.
+    """
+    def call(*args, **kwargs):
+        start = timer()
+        result = None
+        try:
+            result = function(*args, **kwargs)
+            return result
+        finally:
+            sent = countObjects(args[0]) if counted and args else 0
+            serviceTimer.record(
+                method, start, timer() - start, sent + countObjects(result))
+    return call
+
+
+class InstrumentedService(object):
+    """
+    Proxy of a service recording every method call with its ServiceTimer.
+    """
+
+    def __init__(self, service, name, serviceTimer):
+        self._service = service
+        self._name = name
+        self._timer = serviceTimer
+
+    def __getattr__(self, attr):
+        value = getattr(self._service, attr)
+        if attr.startswith("_") or not callable(value):
+            return value
+        return timedCall(self._timer, "%s.%s" % (self._name, attr), value,
+                         attr.startswith("save"))
+
+
+class InstrumentedConnection(object):
+    """
+    Proxy of a BlitzGateway or session whose query and update services
+    are instrumented, as are the gateway calls in TIMED_METHODS that go
+    to the server on their own. Everything else is passed through.
+    """
+
+    TIMED_METHODS = ("getObject", "deleteObjects")
+
+    def __init__(self, connection, serviceTimer):
+        self._connection = connection
+        self._timer = serviceTimer
+
+    def getQueryService(self):
+        return InstrumentedService(
+            self._connection.getQueryService(), "query", self._timer)
+
+    def getUpdateService(self):
+        return InstrumentedService(
+            self._connection.getUpdateService(), "update", self._timer)
+
+    def __getattr__(self, attr):
+        value = getattr(self._connection, attr)
+        if attr in self.TIMED_METHODS:
+            return timedCall(self._timer, "gateway.%s" % attr, value,
+                             attr == "deleteObjects")
+        return value
+
+
+class _Phase(object):
+
+    def __init__(self, serviceTimer, name, waiting):
+        self.timer = serviceTimer
+        self.name = name
+        self.waiting = waiting
+
+    def __enter__(self):
+        self.timer.enter(self.name, self.waiting)
+
+    def __exit__(self, *args):
+        self.timer.exit()
+
+
+class ServiceTimer(object):
+
+    def __init__(self, trace=False):
+        """
+        Collects the service calls of a script run.
+
+        @param trace: keep every single call, for report() to upload
+            them together with the summary as a JSON file.
+        """
+        self.started = timer()
+        self.thread = threading.current_thread()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.phases = OrderedDict()
+        self.events = [] if trace else None
+
+    def connection(self, connection):
+        """
+        Wrap a BlitzGateway or session so that its services are timed.
+        """
+        return InstrumentedConnection(connection, self)
+
+    def phase(self, name, waiting=False):
+        """
+        Context manager attributing the calls and the time of the current
+        thread to the phase name. Phases nest; time is only charged to
+        the innermost one. A waiting phase is one in which the thread
+        only waits for other threads, e.g. on a worker pool; its wall
+        time is reported without a split into service and client time.
+        """
+        return _Phase(self, name, waiting)
+
+    def stack(self):
+        """
+        The [(phase name, entered at)] stack of the current thread. Time
+        other threads spend outside of any phase, such as pool threads
+        waiting for a task, is not charged to anything.
+        """
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            base = MAIN_PHASE
+            if threading.current_thread() is not self.thread:
+                base = None
+            stack = self.local.stack = [(base, timer())]
+        return stack
+
+    def currentPhase(self):
+        return self.stack()[-1][0] or MAIN_PHASE
+
+    def charge(self, name, now, since):
+        if name is None:
+            return
+        with self.lock:
+            self.phaseStats(name).seconds += now - since
+
+    def phaseStats(self, name):
+        if name not in self.phases:
+            self.phases[name] = PhaseStats()
+        return self.phases[name]
+
+    def enter(self, name, waiting=False):
+        stack = self.stack()
+        now = timer()
+        self.charge(stack[-1][0], now, stack[-1][1])
+        stack.append((name, now))
+        if waiting:
+            with self.lock:
+                self.phaseStats(name).waiting = True
+
+    def exit(self):
+        stack = self.stack()
+        now = timer()
+        name, since = stack.pop()
+        self.charge(name, now, since)
+        stack[-1] = (stack[-1][0], now)
+
+    def record(self, method, start, seconds, objects):
+        phase = self.currentPhase()
+        with self.lock:
+            stats = self.phaseStats(phase).methods
+            if method not in stats:
+                stats[method] = MethodStats()
+            stats[method].add(seconds, objects)
+            if self.events is not None:
+                self.events.append({
+                    "phase": phase, "method": method,
+                    "thread": threading.current_thread().name,
+                    "start": round(start - self.started, 6),
+                    "seconds": round(seconds, 6), "objects": objects,
+                })
+
+    def summary(self):
+        """
+        Per phase time split and method statistics. Time the current
+        thread spent outside of any phase so far is charged to "main".
+        """
+        stack = self.stack()
+        now = timer()
+        self.charge(stack[-1][0], now, stack[-1][1])
+        stack[-1] = (stack[-1][0], now)
+        with self.lock:
+            phases = dict((name, stats.summary())
+                          for name, stats in self.phases.items())
+        return {
+            "seconds": round(now - self.started, 6),
+            "calls": sum(phase.get("calls", 0) for phase in phases.values()),
+            "phases": phases,
+        }
+
+    def report(self, client):
+        """
+        Set the summary as the "Timing" output of client. When tracing,
+        the trace is uploaded and returned as the "File_Annotation"
+        output; the working directory of a job does not outlive it.
+        """
+        summary = self.summary()
+        client.setOutput("Timing", wrap(summary))
+        if self.events is not None:
+            client.setOutput(
+                "File_Annotation", robject(self.uploadTrace(client, summary)))
+        return summary
+
+    def uploadTrace(self, client, summary):
+        """
+        Upload the summary and every call as a JSON OriginalFile and
+        return the saved FileAnnotation of it.
+        """
+        handle, path = tempfile.mkstemp(suffix=".json")
+        try:
+            with os.fdopen(handle, "w") as f:
+                json.dump({"summary": summary, "events": self.events}, f,
+                          indent=1, sort_keys=True)
+            originalFile = client.upload(
+                path, name=TRACE_NAME, type="application/json")
+        finally:
+            os.remove(path)
+        annotation = FileAnnotationI()
+        annotation.setFile(OriginalFileI(originalFile.id.val, False))
+        annotation.setNs(rstring(TRACE_NS))
+        return client.getSession().getUpdateService().saveAndReturnObject(
+            annotation)
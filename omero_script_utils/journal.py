@@ -0,0 +1,115 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Checkpoint journals letting a restarted job skip the work an earlier run
+of the same job already finished.
+
+The working directory of a job is removed by the script processor when
+the job ends, so journals are kept in a state directory under the var
+directory of the OMERO installation, one per OMERO user.
+"""
+
+import errno
+import hashlib
+import os
+
+JOURNAL_DIRECTORY = "script_journals"
+
+
+def stateDirectory(name, userId=None):
+    """
+    Return, creating it if needed, the directory name under the var
+    directory of the OMERO installation running the script, or under
+    ~/omero/var outside of one. With userId the directory is that of a
+    single OMERO user. Directories are only accessible to the system
+    user running the script processor.
+    """
+    omeroDir = os.environ.get("OMERODIR") or os.environ.get("OMERO_HOME")
+    if omeroDir:
+        path = os.path.join(omeroDir, "var", name)
+    else:
+        path = os.path.join(os.path.expanduser("~"), "omero", "var", name)
+    if userId is not None:
+        path = os.path.join(path, str(userId))
+    try:
+        os.makedirs(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    return path
+
+
+class checkpointJournal(object):
+
+    def __init__(self, name, key, userId, directory=None):
+        """
+        Append-only journal of completed ids, one "kind id" line each.
+        The file is named after name and a hash of the job key, so that
+        rerunning the same job finds it again.
+
+        @param name: prefix of the journal file name, the script name.
+        @param key: string identifying the job.
+        @param userId: id of the OMERO user running the job.
+        @param directory: directory to keep the journal in instead of the
+            user's journal state directory.
+        """
+        if directory is None:
+            directory = stateDirectory(JOURNAL_DIRECTORY, userId)
+        digest = hashlib.md5(key.encode("utf-8")).hexdigest()
+        self.path = os.path.join(
+            directory, "%s-%s.journal" % (name, digest))
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as journalFile:
+                for line in journalFile:
+                    parts = line.split()
+                    # A line without newline was torn by the crash.
+                    if not line.endswith("\n") or len(parts) != 2:
+                        continue
+                    self.entries.setdefault(parts[0], set()).add(
+                        int(parts[1]))
+            print("Resuming from journal %s" % self.path)
+        self.journalFile = open(self.path, "a")
+
+    def completed(self, kind):
+        """
+        The set of ids of kind recorded so far.
+        """
+        return self.entries.get(kind, set())
+
+    def record(self, kind, ids):
+        """
+        Append ids of kind, synced to disk before returning.
+        """
+        ids = list(ids)
+        for objId in ids:
+            self.journalFile.write("%s %d\n" % (kind, objId))
+        self.journalFile.flush()
+        os.fsync(self.journalFile.fileno())
+        self.entries.setdefault(kind, set()).update(ids)
+
+    def close(self, remove=False):
+        """
+        Close the journal, removing it once the job has finished.
+        """
+        self.journalFile.close()
+        if remove:
+            os.remove(self.path)
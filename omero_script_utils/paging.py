@@ -0,0 +1,157 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Keyset pagination of id-ordered HQL queries.
+
+keysetPages() walks a query restricted on "> :last" and ordered by that
+id one page at a time, binding the id of the last row of a page as :last
+of the next query. Unlike offset paging, every page costs the same no
+matter how deep into the result set it is, and rows are neither skipped
+nor repeated when earlier rows change between pages.
+
+prefetched() runs any page generator on a background thread, so that the
+next page is fetched while the current one is processed.
+"""
+
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from omero.rtypes import rlong
+from omero.sys import ParametersI
+
+PAGE_SIZE = 1000
+
+
+def rowKey(item):
+    """
+    The id of a projection row, its first column, or of a model object.
+    """
+    if isinstance(item, (list, tuple)):
+        return item[0].val
+    return item.id.val
+
+
+def keysetPages(queryService, query, params=None, pageSize=PAGE_SIZE,
+                last=0, ctx=None, key=rowKey, method="projection",
+                timing=None, phase=None, prefetch=False):
+    """
+    Generator of the pages of an id-ordered query.
+
+    @param queryService: omero query service.
+    @param query: HQL restricted on "> :last" and ordered by the same id.
+    @param params: ParametersI with the other bindings of the query. It
+        is reused for every page, with :last and the page limit set.
+    @param pageSize: maximum number of rows or objects per page.
+    @param last: id to start after.
+    @param ctx: call context passed to every query.
+    @param key: function returning the id :last is bound to from the last
+        row or object of a page.
+    @param method: "projection" or "findAllByQuery".
+    @param timing: optional ServiceTimer; with phase, every query runs
+        in that phase.
+    @param prefetch: fetch the next page on a background thread while
+        the current one is processed.
+    """
+    pages = _keysetPages(queryService, query, params, pageSize, last, ctx,
+                         key, method, timing, phase)
+    if prefetch:
+        return prefetched(pages)
+    return pages
+
+
+def _keysetPages(queryService, query, params, pageSize, last, ctx, key,
+                 method, timing, phase):
+    if params is None:
+        params = ParametersI()
+    fetch = getattr(queryService, method)
+    while True:
+        params.add("last", rlong(last))
+        params.page(0, pageSize)
+        if timing is not None and phase is not None:
+            with timing.phase(phase):
+                page = fetch(query, params, ctx)
+        else:
+            page = fetch(query, params, ctx)
+        if len(page) == 0:
+            return
+        yield page
+        # A short page is the last one, no need to ask for an empty page.
+        if len(page) < pageSize:
+            return
+        last = key(page[-1])
+
+
+class _Failure(object):
+
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+def prefetched(pages, depth=1):
+    """
+    Iterate over pages on a background thread, keeping up to depth pages
+    fetched ahead of the consumer. An exception raised while fetching is
+    re-raised in the consumer. Closing the generator stops the thread
+    after the fetch it is busy with.
+    """
+    ready = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        try:
+            for page in pages:
+                if stop.is_set():
+                    return
+                put(page)
+            put(_DONE)
+        except Exception:
+            put(_Failure(sys.exc_info()[1]))
+
+    thread = threading.Thread(target=produce, name="prefetch")
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item = ready.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+        thread.join()
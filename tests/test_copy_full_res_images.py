@@ -0,0 +1,79 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Tests of the routing table of Copy_Full_Res_Images.
+"""
+
+import unittest
+
+from support import loadScript
+
+copy = loadScript("util_scripts/Copy_Full_Res_Images.py")
+
+
+class ParseRoutingTableTest(unittest.TestCase):
+
+    def test_entries(self):
+        self.assertEqual(
+            copy.parseRoutingTable(["^a(.*) => A\\1", "b=>B=>C"]),
+            [("^a(.*)", "A\\1"), ("b", "B=>C")])
+
+    def test_entry_without_arrow(self):
+        with self.assertRaises(ValueError) as raised:
+            copy.parseRoutingTable(["a=>A", "b"])
+        self.assertIn("entry 2", str(raised.exception))
+
+
+class ImageRouterTest(unittest.TestCase):
+
+    def test_first_matching_rule_wins(self):
+        router = copy.imageRouter([("plate1_.*", "first"),
+                                   ("plate.*", "second")])
+        self.assertEqual(router.route("plate1_A01"), "first")
+        self.assertEqual(router.route("plate2_A01"), "second")
+        self.assertIsNone(router.route("other"))
+
+    def test_group_names_per_rule(self):
+        router = copy.imageRouter([
+            ("(?P<plate>P\\d+)_(?P<well>[A-H]\\d+)", "\\g<plate>"),
+            ("(?P<well>[A-H]\\d+)_(?P<plate>P\\d+)", "\\g<plate>-x")])
+        self.assertEqual(router.route("P1_A01"), "P1")
+        self.assertEqual(router.route("B02_P7"), "P7-x")
+
+    def test_inline_flags_per_rule(self):
+        router = copy.imageRouter([("(?i)dapi.*", "dapi"),
+                                   ("gfp.*", "gfp")])
+        self.assertEqual(router.route("DAPI_1"), "dapi")
+        self.assertIsNone(router.route("GFP_1"))
+
+    def test_invalid_regex(self):
+        with self.assertRaises(ValueError) as raised:
+            copy.imageRouter([("a", "A"), ("(", "B")])
+        self.assertIn("rule 2", str(raised.exception))
+
+    def test_template_groups(self):
+        router = copy.imageRouter([("a(.)", "\\1")])
+        self.assertEqual(router.route("ab"), "b")
+        self.assertEqual(router.route("ac"), "c")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Tests of the CSV edits of Edit_Object_Attribute.
+"""
+
+import unittest
+
+from support import loadScript
+
+edit = loadScript("util_scripts/Edit_Object_Attribute.py")
+
+
+class RawFileStore(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.closed = False
+
+    def setFileId(self, file_id, ctx):
+        self.file_id = file_id
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, offset, length):
+        return self.data[offset:offset + length]
+
+    def close(self):
+        self.closed = True
+
+
+class Session(object):
+
+    def __init__(self, data):
+        self.store = RawFileStore(data)
+
+    def createRawFileStore(self):
+        return self.store
+
+
+class ReadCsvEditsTest(unittest.TestCase):
+
+    def test_rows(self):
+        session = Session(
+            b"type,id,attribute,value,attribute type\n"
+            b"Image,1,name,first\n"
+            b"Image, 2 ,description,\"a, b\"\n"
+            b"Dataset,3,version,4,Int\n"
+            b"Image,x,name,skipped\n"
+            b"Image,5,name\n")
+        edits, bad_rows = edit.read_csv_edits(session, 10, "String")
+        self.assertEqual(edits, [
+            ("Image", 1, "name", "String", "first"),
+            ("Image", 2, "description", "String", "a, b"),
+            ("Dataset", 3, "version", "Int", "4")])
+        self.assertEqual(bad_rows, [])
+        self.assertEqual(session.store.file_id, 10)
+        self.assertTrue(session.store.closed)
+
+    def test_unknown_types(self):
+        session = Session(
+            b"Image,1,name,first,bool\n"
+            b"Image,2,name,second,\n"
+            b"Image,3,name,third,Bool\n")
+        edits, bad_rows = edit.read_csv_edits(session, 10, "String")
+        self.assertEqual(edits, [("Image", 3, "name", "Bool", "third")])
+        self.assertEqual(bad_rows, ["line 1: 'bool'", "line 2: ''"])
+
+
+class GroupEditsTest(unittest.TestCase):
+
+    def test_grouped_and_converted(self):
+        grouped = edit.group_edits([
+            ("Image", 1, "name", "String", "a"),
+            ("Image", 1, "version", "Int", "2"),
+            ("Image", 2, "name", "String", "a"),
+            ("Dataset", 1, "name", "String", "b")])
+        self.assertEqual(sorted(grouped), ["Dataset", "Image"])
+        self.assertEqual(sorted(grouped["Image"]), [1, 2])
+        (name, value), (version, number) = grouped["Image"][1]
+        self.assertEqual((name, value.val), ("name", "a"))
+        self.assertEqual((version, number.val), ("version", 2))
+        # Equal values are converted once and shared
+        self.assertIs(grouped["Image"][2][0][1], value)
+        self.assertEqual(grouped["Dataset"][1][0][1].val, "b")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Tests of omero_script_utils.journal.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+from omero_script_utils.journal import checkpointJournal
+
+assert support
+
+
+class CheckpointJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def journal(self, key="job"):
+        return checkpointJournal("Test", key, 2, self.directory)
+
+    def test_resume(self):
+        journal = self.journal()
+        journal.record("image", [1, 2])
+        journal.record("dataset", iter([3]))
+        journal.close()
+        journal = self.journal()
+        self.assertEqual(journal.completed("image"), set([1, 2]))
+        self.assertEqual(journal.completed("dataset"), set([3]))
+        self.assertEqual(journal.completed("plate"), set())
+        journal.close()
+
+    def test_keys_are_separate(self):
+        journal = self.journal("first")
+        journal.record("image", [1])
+        journal.close()
+        journal = self.journal("second")
+        self.assertEqual(journal.completed("image"), set())
+        journal.close()
+
+    def test_torn_line_skipped(self):
+        journal = self.journal()
+        journal.record("image", [1])
+        journal.close()
+        with open(journal.path, "a") as journalFile:
+            journalFile.write("image 2")
+        journal = self.journal()
+        self.assertEqual(journal.completed("image"), set([1]))
+        journal.close()
+
+    def test_close_remove(self):
+        journal = self.journal()
+        journal.record("image", [1])
+        journal.close(remove=True)
+        self.assertFalse(os.path.exists(journal.path))
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Tests of omero_script_utils.paging.
+"""
+
+import threading
+import unittest
+
+import support
+from omero.rtypes import rlong
+from omero_script_utils.paging import keysetPages, prefetched
+
+assert support
+
+
+class QueryService(object):
+    """
+    Serves the ids 1 to size as one-column projection rows, after :last
+    and limited to the page size, recording every call.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.calls = []
+
+    def projection(self, query, params, ctx):
+        last = params.map["last"].val
+        limit = params.theFilter.limit.val
+        self.calls.append(last)
+        return [[rlong(i)] for i in range(last + 1,
+                                          min(last + limit, self.size) + 1)]
+
+
+class KeysetPagesTest(unittest.TestCase):
+
+    def ids(self, pages):
+        return [[row[0].val for row in page] for page in pages]
+
+    def test_short_page_is_the_last(self):
+        service = QueryService(5)
+        pages = self.ids(keysetPages(service, "q", pageSize=2))
+        self.assertEqual(pages, [[1, 2], [3, 4], [5]])
+        self.assertEqual(service.calls, [0, 2, 4])
+
+    def test_full_last_page_asks_once_more(self):
+        service = QueryService(4)
+        pages = self.ids(keysetPages(service, "q", pageSize=2))
+        self.assertEqual(pages, [[1, 2], [3, 4]])
+        self.assertEqual(service.calls, [0, 2, 4])
+
+    def test_start_after_last(self):
+        pages = self.ids(keysetPages(QueryService(5), "q", pageSize=10,
+                                     last=3))
+        self.assertEqual(pages, [[4, 5]])
+
+    def test_prefetch(self):
+        pages = self.ids(keysetPages(QueryService(5), "q", pageSize=2,
+                                     prefetch=True))
+        self.assertEqual(pages, [[1, 2], [3, 4], [5]])
+
+
+class PrefetchedTest(unittest.TestCase):
+
+    def test_error_raised_in_consumer(self):
+        def pages():
+            yield 1
+            raise RuntimeError("fetch failed")
+
+        iterator = prefetched(pages())
+        self.assertEqual(next(iterator), 1)
+        with self.assertRaises(RuntimeError):
+            next(iterator)
+
+    def test_close_stops_the_thread(self):
+        fetched = []
+
+        def pages():
+            for i in range(100):
+                fetched.append(i)
+                yield i
+
+        before = threading.active_count()
+        iterator = prefetched(pages())
+        self.assertEqual(next(iterator), 0)
+        iterator.close()
+        self.assertEqual(threading.active_count(), before)
+        self.assertLess(len(fetched), 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,310 @@
+# coding=utf-8
+"""
+-----------------------------------------------------------------------------
+  Copyright (C) 2026 Glencoe Software, Inc. All rights reserved.
+
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+------------------------------------------------------------------------------
+
+Tests of the checks and the file cache of Populate_Metadata.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import loadScript
+
+import fakeserver
+from omero.model import PlateI
+from omero.rtypes import rint, rlong, rstring
+
+populate = loadScript("util_scripts/Populate_Metadata.py")
+
+
+class ParseWellNamesTest(unittest.TestCase):
+
+    def test_names(self):
+        rows, columns = populate.parse_well_names(
+            ["A1", "b03", " H12 ", "AF48", "A", "12", "1A", ""])
+        self.assertEqual(list(rows), [0, 1, 7, 31, 0, -1, -1, -1])
+        self.assertEqual(list(columns), [0, 2, 11, 47, -1, 11, -1, -1])
+
+
+class CsvTableTest(unittest.TestCase):
+
+    def scores(self, values, header=None):
+        rows = [["Well", "Score"]]
+        rows.extend(["A%d" % i, value] for i, value in enumerate(values, 1))
+        if header is not None:
+            rows.insert(0, header)
+        return populate.CsvTable(rows)
+
+    def test_undeclared_types_not_checked(self):
+        values = [str(i) for i in range(150)] + ["1.5", "n/a"]
+        self.assertEqual(self.scores(values).validate(), [])
+
+    def test_declared_types_checked(self):
+        values = [str(i) for i in range(150)] + ["1.5", ""]
+        table = self.scores(values, ["# header s", "l"])
+        self.assertEqual(table.validate(), [
+            "column Score (l): 1 bad value(s)", "\tline 153: '1.5'"])
+        table = self.scores(["1.5", "yes"], ["# header s", "d"])
+        self.assertEqual(table.validate(), [
+            "column Score (d): 1 bad value(s)", "\tline 4: 'yes'"])
+        table = self.scores(["yes", "False", "maybe"], ["# header s", "b"])
+        self.assertEqual(table.validate(), [
+            "column Score (b): 1 bad value(s)", "\tline 5: 'maybe'"])
+
+    def test_out_of_range_values(self):
+        table = populate.CsvTable([
+            ["# header l", "d"], ["a", "b"],
+            ["99999999999999999999", "1"], ["1", "1e999"]])
+        self.assertEqual(table.validate(), [
+            "column a (l): 1 bad value(s)",
+            "\tline 3: '99999999999999999999'"])
+
+    def test_ragged_rows(self):
+        table = populate.CsvTable(
+            [["Well", "Score"], ["A1"], [], ["A2", "1", "2"]])
+        self.assertEqual(table.validate(), [
+            "line 2: 1 value(s) instead of 2",
+            "line 4: 3 value(s) instead of 2"])
+        self.assertEqual(list(table.column("score")), ["", "1"])
+
+    def test_duplicate_keys(self):
+        table = populate.CsvTable([
+            ["Plate", "Well"], ["P1", "A1"], ["P2", "A1"], ["P1", " A1"]])
+        self.assertEqual(table.validate(["Plate", "Well"]), [
+            "2 row(s) share a key (Plate, Well)",
+            "\tline 2: P1, A1", "\tline 4: P1, A1"])
+        self.assertEqual(table.validate(["Plate", "Missing"]),
+                         ["key column Missing is missing"])
+
+
+class QueryService(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def projection(self, query, params, ctx):
+        return self.rows
+
+
+class Connection(object):
+
+    SERVICE_OPTS = {}
+
+    def __init__(self, rows):
+        self.queryService = QueryService(rows)
+
+    def getQueryService(self):
+        return self.queryService
+
+
+class WellIndexTest(unittest.TestCase):
+
+    def test_resolve(self):
+        conn = Connection([
+            [rlong(10), rint(0), rint(0), rstring("P1")],
+            [rlong(11), None, rint(1), rstring("P1")],
+            [rlong(12), rint(1), rint(2), rstring("P1")],
+            [rlong(13), rint(1), None, rstring("P2")],
+            [rlong(14), rint(0), rint(0), rstring("P2")]])
+        index = populate.WellIndex(conn, "Screen", 1)
+        self.assertEqual(index.skipped, 2)
+        self.assertEqual(
+            list(index.resolve(["A1", "B3", "A2", "A1", "A1"],
+                               ["P1", "P1", "P1", "P2", "P3"])),
+            [10, 12, -1, 14, -1])
+
+    def test_empty(self):
+        index = populate.WellIndex(Connection([]), "Plate", 1)
+        self.assertEqual(list(index.resolve(["A1"])), [-1])
+
+
+class PopulateTargetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = fakeserver.install(
+            fakeserver.Server(fakeserver.Store(), 0))
+        self.lines = ["Well,Score\n"] + [
+            "A%d,%d\n" % (i, i) for i in range(1, 6)]
+
+    def test_streamed_in_batches(self):
+        contexts = []
+
+        class ParsingContext(populate.StreamingParsingContext):
+
+            def __init__(self, *args, **kwargs):
+                super(ParsingContext, self).__init__(*args, **kwargs)
+                contexts.append(self)
+
+        streaming = populate.StreamingParsingContext
+        populate.StreamingParsingContext = ParsingContext
+        try:
+            populate.populate_target(
+                None, PlateI(1, False), lambda: iter(self.lines),
+                {"Stream_File": True, "Batch_Size": 2})
+        finally:
+            populate.StreamingParsingContext = streaming
+        self.assertEqual(contexts[0].batches, [2, 2, 1])
+        streamed = self.server.store.tables.pop(1)
+        populate.populate_target(
+            None, PlateI(1, False), lambda: iter(self.lines), {})
+        self.assertEqual(streamed, self.server.store.tables[1])
+        self.assertEqual(streamed[1], ["Score", "1", "2", "3", "4", "5"])
+
+
+class RawFileStore(object):
+
+    def __init__(self, data):
+        self.data = data
+
+    def setFileId(self, file_id, ctx):
+        pass
+
+    def size(self):
+        return len(self.data)
+
+    def read(self, offset, length):
+        return self.data[offset:offset + length]
+
+    def close(self):
+        pass
+
+
+class FileConnection(object):
+
+    SERVICE_OPTS = {}
+
+    def __init__(self, data):
+        self.data = data
+        self.reads = 0
+
+    def createRawFileStore(self):
+        self.reads += 1
+        return RawFileStore(self.data)
+
+
+class CachedPopulateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.omero_dir = os.environ.get("OMERODIR")
+        os.environ["OMERODIR"] = self.directory
+        self.server = fakeserver.install(
+            fakeserver.Server(fakeserver.Store(), 0))
+
+    def tearDown(self):
+        if self.omero_dir is None:
+            del os.environ["OMERODIR"]
+        else:
+            os.environ["OMERODIR"] = self.omero_dir
+        shutil.rmtree(self.directory)
+
+    def test_cache_hit_parsed_for_the_target(self):
+        store = self.server.store
+        first = store.addPlate("P1")
+        store.addPlate("P2")
+        data = b"Plate,Well,Score\nP1,A1,1\nP2,A1,2\nP1,A2,3\n"
+        conn = FileConnection(data)
+        original_file = OriginalFile(1, len(data), "abc")
+        params = {"Use_Cache": True}
+        for run in range(2):
+            open_file, read_rows = populate.get_file_opener(
+                conn, original_file, params)
+            populate.populate_target(
+                None, PlateI(first, False), open_file, params)
+            self.assertEqual(store.tables.pop(first)[2],
+                             ["Score", "1", "3"])
+            self.assertEqual(len(list(read_rows())), 4)
+        self.assertEqual(conn.reads, 1)
+
+
+class OriginalFile(object):
+
+    def __init__(self, file_id, size, file_hash):
+        self.id = rlong(file_id)
+        self.size = rlong(size)
+        self.hash = rstring(file_hash)
+
+
+class MetadataFileCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        data = u"Well,Name\nA1,été\nA2,\"a, b\"\n".encode("utf-8")
+        original_file = OriginalFile(1, len(data), "abc")
+        cache = populate.MetadataFileCache(self.directory, 1024)
+        self.assertIsNone(cache.get(original_file))
+        path = cache.put(original_file, [data[:10], data[10:]])
+        self.assertEqual(cache.get(original_file), path)
+        with open(path, "rb") as raw_file:
+            self.assertEqual(raw_file.read(), data)
+        rows = list(cache.rows(original_file))
+        expected = [[u"Well", u"Name"], [u"A1", u"été"],
+                    [u"A2", u"a, b"]]
+        if bytes is str:
+            expected = [[value.encode("utf-8") for value in row]
+                        for row in expected]
+        self.assertEqual(rows, expected)
+
+    def test_concurrent_puts(self):
+        data = b"a,b\n"
+        original_file = OriginalFile(1, len(data), "abc")
+        cache = populate.MetadataFileCache(self.directory, 1024)
+
+        def blocks():
+            yield data
+            # Another job caches the same file meanwhile
+            cache.put(original_file, [data])
+
+        path = cache.put(original_file, blocks())
+        with open(path, "rb") as raw_file:
+            self.assertEqual(raw_file.read(), data)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            [os.path.basename(path) for path in cache.paths(original_file)])
+
+    def test_stale_part_files(self):
+        cache = populate.MetadataFileCache(self.directory, 1024)
+        stale = os.path.join(self.directory, "stale.part")
+        recent = os.path.join(self.directory, "recent.part")
+        for path in (stale, recent):
+            with open(path, "wb") as part_file:
+                part_file.write(b"x" * 10)
+        os.utime(stale, (0, 0))
+        cache.evict()
+        self.assertEqual(os.listdir(self.directory), ["recent.part"])
+
+    def test_evict(self):
+        cache = populate.MetadataFileCache(self.directory, 40)
+        first = cache.put(OriginalFile(1, 20, "a"), [b"a,b\n" * 5])
+        os.utime(first, (0, 0))
+        second = cache.put(OriginalFile(2, 20, "b"), [b"c,d\n" * 5])
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,34 +25,154 @@ from omero.gateway import BlitzGateway
 from omero.rtypes import rstring, rlong
 import omero.scripts as scripts
 
-import random
+from multiprocessing.pool import ThreadPool
+
+from omero_script_utils.instrumentation import ServiceTimer
+from omero_script_utils.journal import checkpointJournal
+from omero_script_utils.paging import keysetPages, prefetched
+
+
+class lcBatchSaver:
+
+    def __init__(self, update_service, batch_size, journal=None,
+                 timing=None):
+        """
+        Coalesce renamed LogicalChannel objects across images and save
+        them in chunks of batch_size with a single saveArray call each.
+        Logical channels shared by several images are only queued once.
+        Marks are written to the journal once everything queued before
+        them has been saved, together with the next saved chunk.
+
+        @param update_service: omero update service
+        @param batch_size: number of objects per saveArray call.
+        @param journal: optional checkpointJournal.
+        @param timing: ServiceTimer the saves are reported to.
+        """
+        self.update_service = update_service
+        self.batch_size = batch_size
+        self.journal = journal
+        self.timing = timing if timing is not None else ServiceTimer()
+        self.pending = []
+        self.marks = []
+        self.queued_ids = set()
+        self.saved = 0
+        if journal is not None:
+            self.queued_ids.update(journal.completed("lc"))
+
+    def add(self, lc_list):
+        """
+        Queue logical channels, writing out every full chunk.
+        """
+        for lc in lc_list:
+            lc_id = lc.id.val
+            if lc_id in self.queued_ids:
+                continue
+            self.queued_ids.add(lc_id)
+            self.pending.append(lc)
+        while len(self.pending) >= self.batch_size:
+            self.saveChunk()
+
+    def saveChunk(self):
+        chunk = self.pending[:self.batch_size]
+        del self.pending[:self.batch_size]
+        with self.timing.phase("save"):
+            self.update_service.saveArray(chunk)
+        self.saved += len(chunk)
+        print(("Saved %i logical channels" % self.saved))
+        if self.journal is not None:
+            self.journal.record("lc", [lc.id.val for lc in chunk])
+            self.recordMarks()
+
+    def mark(self, kind, obj_id):
+        """
+        Record obj_id as completed once everything queued so far is saved.
+        """
+        if self.journal is None:
+            return
+        self.marks.append((self.saved + len(self.pending), kind, obj_id))
+
+    def recordMarks(self):
+        """
+        Journal the marks whose objects are all saved, one record call,
+        and so one sync, per kind.
+        """
+        done = 0
+        while done < len(self.marks) and self.marks[done][0] <= self.saved:
+            done += 1
+        ready = {}
+        for position, kind, obj_id in self.marks[:done]:
+            ready.setdefault(kind, []).append(obj_id)
+        for kind, obj_ids in ready.items():
+            self.journal.record(kind, obj_ids)
+        del self.marks[:done]
+
+    def flush(self):
+        """
+        Write out whatever is still queued.
+        """
+        while len(self.pending) > 0:
+            self.saveChunk()
+        if self.journal is not None:
+            self.recordMarks()
 
 
 class renameChannels:
 
-    def __init__(self, conn, scriptParams):
+    def __init__(self, conn, scriptParams, timing=None):
         """
         Class rename channels in an object defined in scriptParams by
         "Data_Type", a list of object "IDs" and "New_Channel_Names".
         source dataset "IDS".
         @param conn: BlitzGateway connector
         @param scriptParams: scipt parameters.
+        @param timing: ServiceTimer the service calls are reported to.
         """
-        self.conn = conn
+        self.timing = timing if timing is not None else ServiceTimer()
+        self.conn = self.timing.connection(conn)
         self.lc_paging = 100
         self.image_paging = 100
         self.data_type = scriptParams["Data_Type"]
         self.ids = scriptParams["IDs"]
         self.new_channel_names = scriptParams["New_Channel_Names"]
-        self.image_id_list = []
+        self.id_only = scriptParams.get("Id_Only", False)
+        self.prefetch = scriptParams.get("Prefetch", False)
+        self.journal = None
+        if scriptParams.get("Checkpoint", False):
+            self.journal = checkpointJournal(
+                "Change_Channel_Names", "%s %s %s" % (
+                    self.data_type, sorted(self.ids),
+                    self.new_channel_names), self.conn.getUserId())
+        self.visited_image_ids = set()
+        if self.journal is not None:
+            self.visited_image_ids.update(self.journal.completed("image"))
+        self.renamed_images = 0
+        self.skipped_images = 0
         self.query_service = self.conn.getQueryService()
         self.update_service = self.conn.getUpdateService()
+        self.saver = lcBatchSaver(
+            self.update_service,
+            scriptParams.get("Save_Batch_Size", 2000), self.journal,
+            self.timing)
         self.get_image_query = \
             "select i from Image i" \
             " left outer join fetch i.pixels as p" \
             " left outer join fetch p.channels as c" \
             " join fetch c.logicalChannel as lc" \
+            " where i.id in (:ids)"
+        self.image_ids_query = \
+            "select distinct i.id from Image i" \
+            " join i.pixels as p" \
+            " join p.channels as c" \
+            " join c.logicalChannel as lc" \
             " where lc.id in (:ids)"
+        self.channel_rows_query = \
+            "select i.id, index(c), lc.id, p.sizeC from Image i" \
+            " join i.pixels as p" \
+            " join p.channels as c" \
+            " join c.logicalChannel as lc" \
+            " where i.id in (:ids)"
+        self.lc_query = \
+            "select lc from LogicalChannel lc where lc.id in (:ids)"
         self.well_query = "select distinct lc.id" \
             " from Well as w" \
             " join w.wellSamples as ws" \
@@ -70,18 +190,19 @@ class renameChannels:
             " join pixels.channels as c" \
             " join c.logicalChannel as lc" \
             " where p.id in (:ids)"
-        self.screen_query = \
-            "select distinct lc.id" \
-            " from Screen as s" \
-            " join s.plateLinks as p_link" \
-            " join p_link.child as p" \
-            " join p.wells as w" \
-            " join w.wellSamples as ws" \
-            " join ws.image as i" \
-            " join i.pixels as pixels" \
-            " join pixels.channels as c" \
-            " join c.logicalChannel as lc" \
-            " where s.id in (:ids)"
+        self.screen_plates_query = \
+            "select distinct link.child.id from ScreenPlateLink link" \
+            " where link.parent.id in (:ids)" \
+            " and link.child.id > :last order by link.child.id"
+        self.screen_images_count_query = \
+            "select count(distinct ws.image.id) from WellSample ws" \
+            " where ws.well.plate.id in" \
+            " (select link.child.id from ScreenPlateLink link" \
+            " where link.parent.id in (:ids))"
+        self.plate_images_query = \
+            "select distinct ws.image.id from WellSample ws" \
+            " where ws.well.plate.id in (:ids)" \
+            " and ws.image.id > :last order by ws.image.id"
         self.dataset_query = \
             "select distinct lc.id" \
             " from Dataset as d" \
@@ -91,17 +212,19 @@ class renameChannels:
             " join pixels.channels as c" \
             " join c.logicalChannel as lc" \
             " where d.id in (:ids)"
-        self.project_query = \
-            "select distinct lc.id" \
-            " from Project p" \
-            " join p.datasetLinks as links" \
-            " join links.child as dataset" \
-            " join dataset.imageLinks as dil" \
-            " join dil.child as i" \
-            " join i.pixels as pixels" \
-            " join pixels.channels as c" \
-            " join c.logicalChannel as lc" \
-            " where p.id in (:ids)"
+        self.project_datasets_query = \
+            "select distinct link.child.id from ProjectDatasetLink link" \
+            " where link.parent.id in (:ids)" \
+            " and link.child.id > :last order by link.child.id"
+        self.project_images_count_query = \
+            "select count(distinct link.child.id) from DatasetImageLink link" \
+            " where link.parent.id in" \
+            " (select pdl.child.id from ProjectDatasetLink pdl" \
+            " where pdl.parent.id in (:ids))"
+        self.dataset_images_query = \
+            "select distinct link.child.id from DatasetImageLink link" \
+            " where link.parent.id in (:ids)" \
+            " and link.child.id > :last order by link.child.id"
         self.image_query = \
             "select distinct lc.id" \
             " from Image as i" \
@@ -110,29 +233,156 @@ class renameChannels:
             " join c.logicalChannel as lc" \
             " where i.id in (:ids)"
 
-    def getLcIdsList(self, query):
+    def getLcCount(self, query, last=0):
+        """
+        Count the logical channels a query will walk after last, used to
+        report the remaining work.
+        """
+        count_query = query.replace(
+            "select distinct lc.id", "select count(distinct lc.id)", 1) \
+            + " and lc.id > :last"
         params = omero.sys.ParametersI()
         params.addIds(self.ids)
-        lc_ids = self.query_service.projection(query, params)
-        if len(lc_ids) == 0:
+        params.add("last", rlong(last))
+        with self.timing.phase("expand"):
+            result = self.query_service.projection(count_query, params)
+        if len(result) == 0 or result[0][0] is None:
+            return 0
+        return result[0][0].val
+
+    def getResumeCursor(self):
+        """
+        Return the lc id the keyset walk resumes after.
+        """
+        if self.journal is None:
+            return 0
+        return max(self.journal.completed("cursor") or [0])
+
+    def iterIdPages(self, query, ids, paging, last=0):
+        """
+        Walk the ids selected by a query in ascending order using keyset
+        pagination, yielding one page of ids at a time.
+
+        @param query: single id column projection filtered on (:ids) and
+                      "> :last", ordered by that id.
+        @param ids: ids bound to :ids.
+        @param paging: page size.
+        @param last: id to start after.
+        """
+        params = omero.sys.ParametersI()
+        params.addIds(ids)
+        for rows in keysetPages(
+                self.query_service, query, params, paging, last,
+                timing=self.timing, phase="expand", prefetch=self.prefetch):
+            yield [row[0].val for row in rows]
+
+    def iterLcImageIdPages(self, query):
+        """
+        Walk the logical channel ids of one of the "select distinct lc.id"
+        queries in ascending order and yield the ids of the images owning
+        each page. The keyset cursor is marked once a page is processed.
+        """
+        last = self.getResumeCursor()
+        remaining = self.getLcCount(query, last)
+        print(("Got %i unique logical channels" % remaining))
+        keyset_query = query + " and lc.id > :last order by lc.id"
+        for lc_ids in self.iterIdPages(
+                keyset_query, self.ids, self.lc_paging, last):
+            yield self.getImageIds(lc_ids)
+            self.saver.mark("cursor", lc_ids[-1])
+            remaining = max(remaining - len(lc_ids), 0)
+            print(("\n%i unique logical channels remains" % remaining))
+
+    def getImageCount(self, count_query):
+        """
+        Count the images a staged expansion will walk, used to report
+        progress against the total.
+        """
+        params = omero.sys.ParametersI()
+        params.addIds(self.ids)
+        with self.timing.phase("expand"):
+            result = self.query_service.projection(count_query, params)
+        if len(result) == 0 or result[0][0] is None:
+            return 0
+        return result[0][0].val
+
+    def iterStagedImageIdPages(self, kind, container_query, image_query,
+                               count_query):
+        """
+        Expand the input ids in stages, first to container (Plate or
+        Dataset) ids and then to image ids per container. Both stages are
+        keyset paged and lazy, so images of the first container are
+        renamed before later pages of containers are fetched.
+        """
+        done = set()
+        if self.journal is not None:
+            done = self.journal.completed(kind)
+        total = self.getImageCount(count_query)
+        print(("Got %i images" % total))
+        finished = 0
+        for container_ids in self.iterIdPages(
+                container_query, self.ids, self.lc_paging):
+            for container_id in container_ids:
+                if container_id in done:
+                    continue
+                for image_ids in self.iterIdPages(
+                        image_query, [container_id], self.image_paging):
+                    yield image_ids
+                self.saver.mark(kind, container_id)
+                finished += 1
+                print(("\nFinished %s %i, %i done, %i of %i images"
+                       % (kind, container_id, finished,
+                          len(self.visited_image_ids), total)))
+
+    def getImageIdPages(self):
+        """
+        Pick the id stream for Data_Type, None if it isn't supported.
+        """
+        if self.data_type == "Screen":
+            return self.iterStagedImageIdPages(
+                "plate", self.screen_plates_query, self.plate_images_query,
+                self.screen_images_count_query)
+        elif self.data_type == "Project":
+            return self.iterStagedImageIdPages(
+                "dataset", self.project_datasets_query,
+                self.dataset_images_query, self.project_images_count_query)
+        query = self.getQuery()
+        if query == "":
             return None
-        lc_ids = [lc_id[0].val for lc_id in lc_ids]
-        return set(lc_ids)
+        return self.iterLcImageIdPages(query)
 
-    def removeLCsFromList(self, image, lc_ids_list):
-        image_noc = image.getPrimaryPixels().getSizeC().getValue()
-        for c in range(image_noc):
-            channel = None
-            try:
-                channel = image.getPrimaryPixels().getChannel(c)
-            except IndexError:
-                pass
-            if channel is None \
-                    or channel.getLogicalChannel() is None:
-                continue
-            lc_id = channel.getLogicalChannel().id.val
-            lc_ids_list.remove(lc_id)
-        return lc_ids_list
+    def getImageIds(self, lc_ids):
+        """
+        Find the images owning a page of logical channels.
+        """
+        params = omero.sys.ParametersI()
+        params.addIds(lc_ids)
+        with self.timing.phase("expand"):
+            rows = self.query_service.projection(
+                self.image_ids_query, params)
+        return [row[0].val for row in rows]
+
+    def loadImageBatches(self, image_ids):
+        for i in range(0, len(image_ids), self.image_paging):
+            params = omero.sys.ParametersI()
+            params.addIds(image_ids[i:i + self.image_paging])
+            with self.timing.phase("load"):
+                images = self.query_service.findAllByQuery(
+                    self.get_image_query, params)
+            yield images
+
+    def loadImages(self, image_ids):
+        """
+        Load images together with all of their channels, paged by
+        image_paging. With Prefetch the next batch of images is loaded
+        while the current one is renamed.
+        """
+        batches = self.loadImageBatches(image_ids)
+        if self.prefetch:
+            batches = prefetched(batches)
+        for images in batches:
+            for image in images:
+                yield image
 
     def renameLCs(self, image):
         number_of_channels = len(self.new_channel_names)
@@ -153,80 +403,191 @@ class renameChannels:
             lc_list.append(lc)
         return lc_list
 
-    def renameBatch(self, lc_ids, step):
-        lc_ids_batch = set(random.sample(lc_ids, step))
+    def renameImage(self, image):
+        """
+        Rename the logical channels of a single image, skipping images
+        whose number of channels doesn't match New_Channel_Names.
+        """
+        image_noc = image.getPrimaryPixels().getSizeC().getValue()
+        if image_noc != len(self.new_channel_names):
+            print(("\tChannels don't match for %s [%s], skipping"
+                   % (image.name.val, image.id.val)))
+            self.skipped_images += 1
+        else:
+            print(("Renaming channels for %s [%s]"
+                   % (image.name.val, image.id.val)))
+            self.saver.add(self.renameLCs(image))
+            self.renamed_images += 1
+        self.saver.mark("image", image.id.val)
+
+    def getChannelRows(self, image_ids):
+        """
+        Map each image id to its sizeC and {channel index: lc id} using a
+        single projection instead of loading the image graphs.
+        """
         params = omero.sys.ParametersI()
-        params.addIds(list(lc_ids_batch))
+        params.addIds(image_ids)
+        with self.timing.phase("load"):
+            rows = self.query_service.projection(
+                self.channel_rows_query, params)
+        channel_rows = {}
+        for image_id, index, lc_id, size_c in rows:
+            image_row = channel_rows.setdefault(image_id.val, (size_c.val, {}))
+            image_row[1][index.val] = lc_id.val
+        return channel_rows
+
+    def renameImagesById(self, image_ids):
+        """
+        Id-only rename: work out the new name of every logical channel
+        from the projection, then load just the bare LogicalChannel rows
+        to set the names on.
+        """
         number_of_channels = len(self.new_channel_names)
-        paging = self.image_paging
-        counter = 0
-        while len(lc_ids_batch) > 0:
-            params.page(counter * paging, paging)
-            counter += 1
-            image_list = self.query_service.findAllByQuery(
-                self.get_image_query, params)
-            print(("Retrived %i images" % len(image_list)))
-            for image in image_list:
-                image_noc = image.getPrimaryPixels().getSizeC().getValue()
-                if image_noc != number_of_channels:
-                    print(("\tChannels don't match for %s [%s], skipping"
-                           % (image.name.val, image.id.val)))
-                    lc_ids = self.removeLCsFromList(image, lc_ids)
-                    lc_ids_batch = self.removeLCsFromList(image, lc_ids_batch)
+        new_names = {}
+        renamed_ids = []
+        for i in range(0, len(image_ids), self.image_paging):
+            channel_rows = self.getChannelRows(
+                image_ids[i:i + self.image_paging])
+            for image_id, (size_c, lc_ids) in channel_rows.items():
+                if size_c != number_of_channels:
+                    print(("\tChannels don't match for image [%s], skipping"
+                           % image_id))
+                    self.skipped_images += 1
+                    self.saver.mark("image", image_id)
                     continue
-                for c in range(image_noc):
-                    channel = None
-                    try:
-                        channel = image.getPrimaryPixels().getChannel(c)
-                    except IndexError:
-                        pass
-                    if channel is None or channel.getLogicalChannel() is None:
-                        continue
-                    if channel.getLogicalChannel().id.val not in lc_ids:
-                        return lc_ids
-                print(("Renaming channels for %s [%s]"
-                       % (image.name.val, image.id.val)))
-                lc_list = self.renameLCs(image)
-                self.update_service.saveArray(lc_list)
-                lc_list = set([lc.id.val for lc in lc_list])
-                lc_ids = lc_ids - lc_list
-                lc_ids_batch = lc_ids_batch - lc_list
-        return lc_ids
-
-    def renameImages(self, lc_ids):
-        step = self.lc_paging
-        print(("Got %i unique logical channels" % len(lc_ids)))
-        while len(lc_ids) > 0:
-            if len(lc_ids) < 100:
-                step = len(lc_ids)
-            lc_ids = self.renameBatch(lc_ids, step)
-            print(("\n%i unique logical channels remains" % len(lc_ids)))
+                print(("Renaming channels for image [%s]" % image_id))
+                for c, lc_id in lc_ids.items():
+                    if c < number_of_channels \
+                            and lc_id not in self.saver.queued_ids:
+                        new_names[lc_id] = self.new_channel_names[c]
+                renamed_ids.append(image_id)
+                self.renamed_images += 1
+        lc_ids = sorted(new_names)
+        for i in range(0, len(lc_ids), self.lc_paging):
+            params = omero.sys.ParametersI()
+            params.addIds(lc_ids[i:i + self.lc_paging])
+            with self.timing.phase("load"):
+                lc_list = self.query_service.findAllByQuery(
+                    self.lc_query, params)
+            for lc in lc_list:
+                lc.setName(rstring(new_names[lc.id.val]))
+            self.saver.add(lc_list)
+        for image_id in renamed_ids:
+            self.saver.mark("image", image_id)
+
+    def renameImages(self, image_id_pages):
+        """
+        Rename every image of a stream of image id pages. Each image is
+        visited exactly once, even when it shows up in several pages.
+        Returns False if the stream was empty.
+        """
+        found = False
+        for page in image_id_pages:
+            found = True
+            image_ids = [image_id for image_id in page
+                         if image_id not in self.visited_image_ids]
+            self.visited_image_ids.update(image_ids)
+            print(("Retrieved %i images" % len(image_ids)))
+            if self.id_only:
+                self.renameImagesById(image_ids)
+            else:
+                for image in self.loadImages(image_ids):
+                    self.renameImage(image)
+        self.saver.flush()
+        return found
 
     def getQuery(self):
-        if self.data_type == "Screen":
-            return self.screen_query
-        elif self.data_type == "Plate":
+        if self.data_type == "Plate":
             return self.plate_query
         elif self.data_type == "Well":
             return self.well_query
-        elif self.data_type == "Project":
-            return self.project_query
         elif self.data_type == "Dataset":
             return self.dataset_query
         elif self.data_type == "Image":
             return self.image_query
         else:
-            print("")
+            return ""
 
     def run(self):
-        query = self.getQuery()
-        if query == "":
+        image_id_pages = self.getImageIdPages()
+        if image_id_pages is None:
             return "Object type not supported."
-        lc_ids = self.getLcIdsList(query)
-        if lc_ids is None:
+        renamed = self.renameImages(image_id_pages)
+        if self.journal is not None:
+            self.journal.close(remove=True)
+        if not renamed:
             return "No images to rename."
-        self.renameImages(lc_ids)
-        return "Done"
+        return "Done. Renamed %i image(s), skipped %i." % (
+            self.renamed_images, self.skipped_images)
+
+
+def getPlateIds(conn, data_type, ids):
+    """
+    Split Screen and Plate inputs into their plate ids.
+    """
+    if data_type == "Plate":
+        return sorted(set(ids))
+    params = omero.sys.ParametersI()
+    params.addIds(ids)
+    return [row[0].val for rows in keysetPages(
+        conn.getQueryService(),
+        "select distinct link.child.id from ScreenPlateLink link"
+        " where link.parent.id in (:ids)"
+        " and link.child.id > :last order by link.child.id", params)
+        for row in rows]
+
+
+def renamePlate(client, scriptParams, plate_id, timing=None):
+    """
+    Rename the channels of a single plate on a worker session joined
+    from the parent client. Returns (plate_id, renamed, skipped, error).
+    """
+    worker_client = client.createClient(secure=True)
+    try:
+        conn = BlitzGateway(client_obj=worker_client)
+        plate_params = dict(scriptParams)
+        plate_params["Data_Type"] = "Plate"
+        plate_params["IDs"] = [plate_id]
+        nameChanger = renameChannels(conn, plate_params, timing)
+        nameChanger.run()
+        return (plate_id, nameChanger.renamed_images,
+                nameChanger.skipped_images, None)
+    except Exception as e:
+        return (plate_id, 0, 0, str(e))
+    finally:
+        worker_client.closeSession()
+
+
+def renamePlatesInParallel(client, conn, scriptParams, timing=None):
+    """
+    Rename channels plate by plate on a pool of "Workers" threads and
+    merge the per-plate results into one summary.
+    """
+    if timing is None:
+        timing = ServiceTimer()
+    plate_ids = getPlateIds(
+        conn, scriptParams["Data_Type"], scriptParams["IDs"])
+    if len(plate_ids) == 0:
+        return "No images to rename."
+    pool = ThreadPool(min(scriptParams["Workers"], len(plate_ids)))
+    try:
+        with timing.phase("workers", waiting=True):
+            results = pool.map(
+                lambda plate_id: renamePlate(
+                    client, scriptParams, plate_id, timing),
+                plate_ids)
+    finally:
+        pool.close()
+        pool.join()
+    renamed = sum(result[1] for result in results)
+    skipped = sum(result[2] for result in results)
+    errors = ["%s (%s)" % (result[0], result[3])
+              for result in results if result[3] is not None]
+    message = "Done. Renamed %i image(s), skipped %i in %i plate(s)." % (
+        renamed, skipped, len(plate_ids) - len(errors))
+    if errors:
+        message += " Failed plates: %s" % "; ".join(errors)
+    return message
 
 
 def runAsScript():
@@ -258,6 +619,36 @@ def runAsScript():
             description="Comma separated list of the new Channel Names"
         ).ofType(rstring(",")),
 
+        scripts.Int(
+            "Save_Batch_Size", optional=True, grouping="4", default=2000,
+            min=1, description="Number of renamed logical channels"
+            " written to the server per call."),
+
+        scripts.Bool(
+            "Id_Only", optional=True, grouping="5", default=False,
+            description="Rename from an id projection without loading"
+            " the Image graphs."),
+
+        scripts.Bool(
+            "Checkpoint", optional=True, grouping="6", default=False,
+            description="Keep a journal of completed work on the server"
+            " host and resume from it when the job is restarted."),
+
+        scripts.Int(
+            "Workers", optional=True, grouping="7", default=1, min=1,
+            description="Number of plates of a Screen or Plate input"
+            " renamed concurrently, each on its own session."),
+
+        scripts.Bool(
+            "Timing_Trace", optional=True, grouping="8", default=False,
+            description="Attach a JSON trace of every query and update"
+            " call as a file output."),
+
+        scripts.Bool(
+            "Prefetch", optional=True, grouping="9", default=False,
+            description="Fetch the next page of ids and images on a"
+            " background thread while the current one is renamed."),
+
         version="0.1",
         authors=["Emil Rozbicki"],
         institutions=["Glencoe Software Inc."],
@@ -273,10 +664,17 @@ def runAsScript():
 
         # wrap client to use the Blitz Gateway
         conn = BlitzGateway(client_obj=client)
-        nameChanger = renameChannels(conn, scriptParams)
-        message = nameChanger.run()
+        timing = ServiceTimer(scriptParams.get("Timing_Trace", False))
+        if scriptParams["Data_Type"] in ("Screen", "Plate") \
+                and scriptParams.get("Workers", 1) > 1:
+            message = renamePlatesInParallel(
+                client, timing.connection(conn), scriptParams, timing)
+        else:
+            nameChanger = renameChannels(conn, scriptParams, timing)
+            message = nameChanger.run()
         print(message)
         client.setOutput("Message", rstring(message))
+        timing.report(client)
     finally:
         client.closeSession()
 
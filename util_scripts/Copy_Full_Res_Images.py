@@ -22,15 +22,154 @@
 
 import omero
 from omero.gateway import BlitzGateway
-from omero.rtypes import rstring, rlong
+from omero.rtypes import rstring, rlong, rlist
 import omero.scripts as scripts
 
 import re
 
+import numpy as np
+
+from omero_script_utils.instrumentation import ServiceTimer
+from omero_script_utils.journal import checkpointJournal
+from omero_script_utils.paging import keysetPages
+
+
+class imageRouter:
+
+    def __init__(self, rules):
+        """
+        Ordered routing table mapping image names to target dataset names.
+        Every rule pattern is compiled once, on its own so that its flags
+        and group names are its own. The rules are tried in order, the
+        first one that matches wins and its template is expanded with
+        that match's groups. Results are not memoized, image names are
+        nearly always unique and a memo would keep one entry per image.
+
+        @param rules: list of (regex, dataset name template) pairs.
+        """
+        self.rules = []
+        for number, (pattern, template) in enumerate(rules, 1):
+            try:
+                self.rules.append((re.compile(pattern), template))
+            except re.error as e:
+                raise ValueError(
+                    "Routing rule %i: invalid regex %r: %s"
+                    % (number, pattern, e))
+
+    def route(self, name):
+        """
+        Return the target dataset name for an image name, None if no rule
+        matches.
+        """
+        for pattern, template in self.rules:
+            match = pattern.match(name)
+            if match is not None:
+                return match.expand(template)
+        return None
+
+
+def parseRoutingTable(routing_table):
+    """
+    Split "regex=>template" entries of the Routing_Table parameter. A
+    malformed entry is reported with its 1-based number.
+    """
+    rules = []
+    for number, entry in enumerate(routing_table, 1):
+        if "=>" not in entry:
+            raise ValueError(
+                "Routing_Table entry %i has no '=>' between regex and"
+                " template: %r" % (number, entry))
+        pattern, template = entry.split("=>", 1)
+        rules.append((pattern.strip(), template.strip()))
+    return rules
+
+
+class imagePlan:
+
+    def __init__(self, block_size=4096):
+        """
+        Compact image -> target dataset plan for very large copies. Image
+        ids and integer dataset name codes are kept in NumPy arrays and
+        every distinct dataset name is stored once, so no per-image
+        Python objects outlive the listing.
+
+        @param block_size: number of rows buffered before they are packed
+                           into arrays.
+        """
+        self.block_size = block_size
+        self.names = []
+        self.codes_by_name = {}
+        self.pending_ids = []
+        self.pending_codes = []
+        self.id_blocks = []
+        self.code_blocks = []
+        self.image_ids = np.zeros(0, dtype=np.int64)
+        self.name_codes = np.zeros(0, dtype=np.int32)
+        self.group_codes = np.zeros(0, dtype=np.int32)
+        self.group_bounds = np.zeros(1, dtype=np.int64)
+
+    def add(self, image_id, dataset_name):
+        code = self.codes_by_name.get(dataset_name)
+        if code is None:
+            code = len(self.names)
+            self.names.append(dataset_name)
+            self.codes_by_name[dataset_name] = code
+        self.pending_ids.append(image_id)
+        self.pending_codes.append(code)
+        if len(self.pending_ids) >= self.block_size:
+            self.packBlock()
+
+    def packBlock(self):
+        self.id_blocks.append(np.array(self.pending_ids, dtype=np.int64))
+        self.code_blocks.append(
+            np.array(self.pending_codes, dtype=np.int32))
+        self.pending_ids = []
+        self.pending_codes = []
+
+    def build(self, exclude=None):
+        """
+        Pack the remaining rows, drop the excluded image ids and group the
+        plan by dataset with a stable argsort.
+
+        @param exclude: optional collection of image ids to leave out.
+        """
+        if len(self.pending_ids) > 0:
+            self.packBlock()
+        if len(self.id_blocks) > 0:
+            self.image_ids = np.concatenate(self.id_blocks)
+            self.name_codes = np.concatenate(self.code_blocks)
+        self.id_blocks = []
+        self.code_blocks = []
+        if exclude:
+            keep = ~np.isin(self.image_ids, np.array(
+                list(exclude), dtype=np.int64))
+            self.image_ids = self.image_ids[keep]
+            self.name_codes = self.name_codes[keep]
+        order = np.argsort(self.name_codes, kind="mergesort")
+        self.image_ids = self.image_ids[order]
+        self.name_codes = self.name_codes[order]
+        self.group_codes, starts = np.unique(
+            self.name_codes, return_index=True)
+        self.group_bounds = np.append(starts, len(self.image_ids))
+
+    def __len__(self):
+        return len(self.image_ids)
+
+    def datasetNames(self):
+        return set(self.names[code] for code in self.group_codes)
+
+    def iterGroups(self):
+        """
+        Yield (dataset_name, image_ids array) for every target dataset.
+        """
+        for i, code in enumerate(self.group_codes):
+            yield self.names[code], self.image_ids[
+                self.group_bounds[i]:self.group_bounds[i + 1]]
+
 
 class copyHighResImages:
 
-    def __init__(self, conn, scriptParams):
+    def __init__(self, conn, scriptParams, timing=None):
         """
         Class to copy high resolution svs and afi files to the new datasets.
         scriptParams have to include target "Project_ID" and a list of
@@ -38,84 +177,157 @@ class copyHighResImages:
 
         @param conn: BlitzGateway connector
         @param scriptParams: scipt parameters.
+        @param timing: ServiceTimer the service calls are reported to.
         """
 
-        self.FILENAME_REGEX = re.compile(scriptParams["Regex_String"])
-        self.conn = conn
+        if scriptParams.get("Routing_Table"):
+            rules = parseRoutingTable(scriptParams["Routing_Table"])
+        else:
+            rules = [(scriptParams["Regex_String"], r"\1")]
+        self.router = imageRouter(rules)
+        self.timing = timing if timing is not None else ServiceTimer()
+        self.conn = self.timing.connection(conn)
         self.target_project_id = scriptParams["Project_ID"]
         self.source_datasets_list = scriptParams["IDs"]
-        self.image_dict = self.getImageList()
-        self.target_dataset_names = self.getTargetDatasetNames()
+        self.link_only = scriptParams.get("Link_Only", False)
+        self.prefetch = scriptParams.get("Prefetch", False)
+        self.journal = None
+        if scriptParams.get("Checkpoint", False):
+            self.journal = checkpointJournal(
+                "Copy_Full_Res_Images", "%s %s %s" % (
+                    self.target_project_id,
+                    sorted(self.source_datasets_list), rules),
+                self.conn.getUserId())
+        self.image_paging = 1000
+        self.name_paging = 1000
+        self.link_paging = 1000
         self.query_service = self.conn.getQueryService()
         self.update_service = self.conn.getUpdateService()
+        self.image_rows_query = \
+            "select distinct i.id, i.name from DatasetImageLink as link" \
+            " join link.child as i" \
+            " where link.parent.id in (:ids) and i.id > :last" \
+            " order by i.id"
+        self.image_plan = self.getImageList()
+        self.target_dataset_names = self.getTargetDatasetNames()
         self.dataset_query = \
-            "select d from Project as p" \
-            " left outer join p.datasetLinks as links" \
-            " left outer join links.child as d" \
+            "select distinct d from Project as p" \
+            " join p.datasetLinks as links" \
+            " join links.child as d" \
             " left outer join fetch d.imageLinks as i_link" \
             " left outer join fetch i_link.child" \
-            " where p.id = :pid and d.name = :dname"
+            " where p.id = :pid and d.name in (:dnames)" \
+            " order by d.id"
+        self.dataset_ids_query = \
+            "select d.id, d.name from Project as p" \
+            " join p.datasetLinks as links" \
+            " join links.child as d" \
+            " where p.id = :pid and d.name in (:dnames)" \
+            " order by d.id"
+        self.existing_links_query = \
+            "select link.id, link.parent.id, link.child.id" \
+            " from DatasetImageLink as link" \
+            " where link.parent.id in (:ids) and link.id > :last" \
+            " order by link.id"
+
+    def iterImageRows(self):
+        """
+        Stream (image_id, image_name) of all images in the source datasets
+        from a keyset paged projection.
+        """
+        params = omero.sys.ParametersI()
+        params.addIds(self.source_datasets_list)
+        for rows in keysetPages(
+                self.query_service, self.image_rows_query, params,
+                self.image_paging, timing=self.timing, phase="list",
+                prefetch=self.prefetch):
+            for row in rows:
+                yield row[0].val, row[1].val
 
     def getImageList(self):
         """
         Retrive images from the source datasets.
         """
 
-        image_dict = {}
-        for datasetId in self.source_datasets_list:
-            dataset = conn.getObject("Dataset", datasetId)
-            for image in dataset.listChildren():
-                if "[" in image.getName():
-                    continue
-                file_name = self.FILENAME_REGEX.match(image.getName())
-                if file_name is None:
-                    continue
-                image_dict[image.getId()] = file_name.group(1)
-        return image_dict
+        image_plan = imagePlan()
+        for image_id, image_name in self.iterImageRows():
+            if "[" in image_name:
+                continue
+            dataset_name = self.router.route(image_name)
+            if dataset_name is None:
+                continue
+            image_plan.add(image_id, dataset_name)
+        exclude = None
+        if self.journal is not None:
+            exclude = self.journal.completed("image")
+        image_plan.build(exclude)
+        return image_plan
 
     def printImageList(self):
-        for image in self.image_dict:
-            print((image, self.image_dict[image]))
+        for dataset_name, image_ids in self.image_plan.iterGroups():
+            for image_id in image_ids:
+                print((image_id, dataset_name))
 
     def getTargetDatasetNames(self):
         """
-        Convert image names to target dataset names and return as unique
-        list.
+        Return the unique target dataset names of the plan.
         """
-        dataset_names = set()
-        for image in self.image_dict:
-            dataset_names.add(self.image_dict[image])
-        return dataset_names
+        return self.image_plan.datasetNames()
 
-    def getDatasetMap(self):
+    def findDatasets(self, names):
         """
-        Convert unique list of dataset names to a map
-        (dataset_name, dataset_object).
+        Look up the target project's datasets by name, name_paging names
+        per query. When names are duplicated the oldest dataset wins.
         """
         dataset_map = {}
-        params = omero.sys.ParametersI()
-        params.add("pid", rlong(self.target_project_id))
-        for name in self.target_dataset_names:
-            params.add("dname", rstring(name))
-            dataset = self.query_service.findByQuery(
-                self.dataset_query, params)
-            if dataset is None:
-                print("Creating new datset")
-                dataset = omero.model.DatasetI()
-                dataset.setName(rstring(name))
-                dataset = \
-                    self.update_service.saveAndReturnObject(dataset)
-                datasetId = dataset.getId().getValue()
-                print(("\tNew dataset ID:", datasetId))
-                link = omero.model.ProjectDatasetLinkI()
-                print(("\tLinking dataset to:", self.target_project_id))
-                link.parent = omero.model.ProjectI(
-                    self.target_project_id, False)
-                link.child = omero.model.DatasetI(datasetId, False)
-                self.update_service.saveObject(link)
-                dataset = self.query_service.findByQuery(
+        names = sorted(names)
+        for i in range(0, len(names), self.name_paging):
+            params = omero.sys.ParametersI()
+            params.add("pid", rlong(self.target_project_id))
+            params.add("dnames", rlist(
+                [rstring(name) for name in names[i:i + self.name_paging]]))
+            if self.link_only:
+                with self.timing.phase("datasets"):
+                    rows = self.query_service.projection(
+                        self.dataset_ids_query, params)
+                for row in rows:
+                    dataset_map.setdefault(
+                        row[1].val, omero.model.DatasetI(row[0].val, False))
+                continue
+            with self.timing.phase("datasets"):
+                datasets = self.query_service.findAllByQuery(
                     self.dataset_query, params)
-            dataset_map[name] = dataset
+            for dataset in datasets:
+                dataset_map.setdefault(dataset.getName().getValue(), dataset)
+        return dataset_map
+
+    def getDatasetMap(self):
+        """
+        Convert unique list of dataset names to a map
+        (dataset_name, dataset_object). Missing datasets are created
+        together with their project links in a single call.
+        """
+        dataset_map = self.findDatasets(self.target_dataset_names)
+        missing = [name for name in self.target_dataset_names
+                   if name not in dataset_map]
+        if len(missing) == 0:
+            return dataset_map
+        print(("Creating %i new datasets" % len(missing)))
+        links = []
+        for name in missing:
+            dataset = omero.model.DatasetI()
+            dataset.setName(rstring(name))
+            link = omero.model.ProjectDatasetLinkI()
+            link.parent = omero.model.ProjectI(
+                self.target_project_id, False)
+            link.child = dataset
+            links.append(link)
+        with self.timing.phase("datasets"):
+            links = self.update_service.saveAndReturnArray(links)
+        for link in links:
+            print(("\tNew dataset ID:", link.child.id.val,
+                   "linked to:", self.target_project_id))
+        dataset_map.update(self.findDatasets(missing))
         return dataset_map
 
     def saveImagesToServer(self, dataset_dict):
@@ -127,28 +339,105 @@ class copyHighResImages:
         dataset_list = []
         for dataset_name in dataset_dict:
             dataset_list.append(dataset_dict[dataset_name])
-        self.update_service.saveAndReturnArray(dataset_list)
+        with self.timing.phase("save"):
+            self.update_service.saveAndReturnArray(dataset_list)
 
     def copyImages(self):
         """
-        Link images to the target datasets.
+        Link images to the target datasets. Each target dataset is saved
+        as soon as its images are linked and, when checkpointing, the
+        image ids are journaled.
         """
         dataset_dict = self.getDatasetMap()
-        for image_id in self.image_dict:
-            dataset_target = dataset_dict[self.image_dict[image_id]]
-            image_ids = [
-                v.id.val for v in dataset_target.linkedImageList()]
-            if image_id in image_ids:
-                continue
-            print(("Copying image:", image_id, self.image_dict[image_id]))
-            dataset_target.linkImage(omero.model.ImageI(image_id, False))
-        self.saveImagesToServer(dataset_dict)
+        for dataset_name, image_ids in self.image_plan.iterGroups():
+            dataset_target = dataset_dict[dataset_name]
+            image_ids = image_ids.tolist()
+            linked_ids = set(
+                v.id.val for v in dataset_target.linkedImageList())
+            for image_id in image_ids:
+                if image_id in linked_ids:
+                    continue
+                linked_ids.add(image_id)
+                print(("Copying image:", image_id, dataset_name))
+                dataset_target.linkImage(
+                    omero.model.ImageI(image_id, False))
+            self.saveImagesToServer({dataset_name: dataset_target})
+            if self.journal is not None:
+                self.journal.record("image", image_ids)
+
+    def getExistingLinks(self, dataset_ids):
+        """
+        Return the (dataset_ids, image_ids) arrays of the links already
+        present in the target datasets, sorted by dataset id and read from
+        a keyset paged projection.
+        """
+        parent_blocks = []
+        child_blocks = []
+        params = omero.sys.ParametersI()
+        params.addIds(dataset_ids)
+        for rows in keysetPages(
+                self.query_service, self.existing_links_query, params,
+                self.link_paging, timing=self.timing, phase="links",
+                prefetch=self.prefetch):
+            parent_blocks.append(
+                np.array([row[1].val for row in rows], dtype=np.int64))
+            child_blocks.append(
+                np.array([row[2].val for row in rows], dtype=np.int64))
+        if len(parent_blocks) == 0:
+            return (np.zeros(0, dtype=np.int64),
+                    np.zeros(0, dtype=np.int64))
+        parents = np.concatenate(parent_blocks)
+        children = np.concatenate(child_blocks)
+        order = np.argsort(parents, kind="mergesort")
+        return parents[order], children[order]
+
+    def saveLinks(self, links):
+        with self.timing.phase("save"):
+            self.update_service.saveArray(links)
+        print(("Saved %i new links" % len(links)))
+        if self.journal is not None:
+            self.journal.record(
+                "image", [link.child.id.val for link in links])
+
+    def linkImages(self):
+        """
+        Link-only copy: create just the missing DatasetImageLinks, checked
+        against the existing links of each dataset, and save them in
+        chunks of link_paging.
+        """
+        dataset_dict = self.getDatasetMap()
+        dataset_ids = dict((name, dataset.id.val)
+                           for name, dataset in dataset_dict.items())
+        parents, children = self.getExistingLinks(
+            list(dataset_ids.values()))
+        links = []
+        for dataset_name, image_ids in self.image_plan.iterGroups():
+            dataset_id = dataset_ids[dataset_name]
+            start = np.searchsorted(parents, dataset_id, side="left")
+            end = np.searchsorted(parents, dataset_id, side="right")
+            new_ids = image_ids[~np.isin(image_ids, children[start:end])]
+            print(("Copying %i images to %s" % (len(new_ids), dataset_name)))
+            for image_id in new_ids.tolist():
+                link = omero.model.DatasetImageLinkI()
+                link.parent = omero.model.DatasetI(dataset_id, False)
+                link.child = omero.model.ImageI(image_id, False)
+                links.append(link)
+                if len(links) == self.link_paging:
+                    self.saveLinks(links)
+                    links = []
+        if len(links) > 0:
+            self.saveLinks(links)
 
     def run(self):
         """
         Call this methods after class instantiate to copy the images.
         """
-        self.copyImages()
+        if self.link_only:
+            self.linkImages()
+        else:
+            self.copyImages()
+        if self.journal is not None:
+            self.journal.close(remove=True)
         return "Done"
 
 
@@ -178,6 +467,33 @@ if __name__ == "__main__":
             description="New dataset name will be based on the image name" +
             "formated by regex", default=r"^(\w+-\w+)-.*"),
 
+        scripts.Bool(
+            "Checkpoint", optional=True, grouping="5", default=False,
+            description="Journal copied images on the server host and"
+            " skip them when the job is restarted."),
+
+        scripts.Bool(
+            "Link_Only", optional=True, grouping="6", default=False,
+            description="Only create the missing image links instead of"
+            " saving the whole target datasets."),
+
+        scripts.List(
+            "Routing_Table", optional=True, grouping="7",
+            description="Ordered 'regex=>dataset name template' rules,"
+            " e.g. '^(\\w+)-.*\\.svs$=>\\1 SVS'. The first matching"
+            " rule wins. Replaces Regex_String when set."
+        ).ofType(rstring("")),
+
+        scripts.Bool(
+            "Timing_Trace", optional=True, grouping="8", default=False,
+            description="Attach a JSON trace of every query and update"
+            " call as a file output."),
+
+        scripts.Bool(
+            "Prefetch", optional=True, grouping="9", default=False,
+            description="Fetch the next page of image rows and links on a"
+            " background thread while the current one is processed."),
+
         version="0.1",
         authors=["Emil Rozbicki"],
         institutions=["Glencoe Software Inc."],
@@ -192,8 +508,10 @@ if __name__ == "__main__":
                 scriptParams[key] = client.getInput(key, unwrap=True)
         # wrap client to use the Blitz Gateway
         conn = BlitzGateway(client_obj=client)
-        processImages = copyHighResImages(conn, scriptParams)
+        timing = ServiceTimer(scriptParams.get("Timing_Trace", False))
+        processImages = copyHighResImages(conn, scriptParams, timing)
         message = processImages.run()
         client.setOutput("Message", rstring(message))
+        timing.report(client)
     finally:
         client.closeSession()
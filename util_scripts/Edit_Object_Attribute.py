@@ -24,10 +24,151 @@ Edit the attributes of an object.
 
 import omero
 import omero.clients
-from omero.rtypes import rstring, rtype, rtime, rdouble
+from omero.rtypes import rlong, rstring, rtype, rtime, rdouble
+from omero.sys import ParametersI
 import omero.scripts as scripts
+
+import csv
+
+from omero_script_utils.instrumentation import ServiceTimer
+from omero_script_utils.paging import prefetched
+
 assert omero
 
+BATCH_SIZE = 1000
+MAX_REPORTED = 20
+
+CONVERTERS = {
+    'Bool': lambda value: rtype(bool(value)),
+    'Double': lambda value: rdouble(float(value)),
+    'Float': lambda value: rtype(float(value)),
+    'Int': lambda value: rtype(int(value)),
+    'Long': lambda value: rtype(int(value)),
+    'Time': lambda value: rtime(int(value)),
+    'String': lambda value: rtype(value),
+}
+
+
+def convert(attribute_type, value):
+    return CONVERTERS.get(attribute_type, CONVERTERS['String'])(value)
+
+
+def read_csv_edits(session, file_id, attribute_type):
+    '''
+    Read (type, id, attribute, value) rows from an uploaded CSV file. An
+    optional fifth column overrides Attribute_Type for that row and a
+    header row is skipped. Returns the edits and a list of the rows whose
+    attribute type isn't one of CONVERTERS.
+    '''
+    store = session.createRawFileStore()
+    try:
+        store.setFileId(file_id, {'omero.group': '-1'})
+        data = store.read(0, store.size())
+    finally:
+        store.close()
+    if bytes is not str:
+        data = data.decode('utf-8')
+    edits = []
+    bad_rows = []
+    for line, row in enumerate(csv.reader(data.splitlines()), 1):
+        if len(row) < 4 or not row[1].strip().isdigit():
+            continue
+        row_type = row[4].strip() if len(row) > 4 else attribute_type
+        if row_type not in CONVERTERS:
+            bad_rows.append('line %d: %r' % (line, row_type))
+            continue
+        edits.append((row[0].strip(), int(row[1]), row[2].strip(),
+                      row_type, row[3]))
+    return edits, bad_rows
+
+
+def group_edits(edits):
+    '''
+    Convert the values and group the edits as
+    {data_type: {id: [(attribute, value)]}}. Every distinct value is
+    only converted once.
+    '''
+    converted = {}
+    grouped = {}
+    for data_type, object_id, attribute, attribute_type, value in edits:
+        key = (attribute_type, value)
+        if key not in converted:
+            converted[key] = convert(attribute_type, value)
+        grouped.setdefault(data_type, {}).setdefault(object_id, []).append(
+            (attribute, converted[key]))
+    return grouped
+
+
+def resolve_groups(query_service, data_type, ids):
+    '''
+    Partition the ids of a type by group with a projection, paged by
+    BATCH_SIZE ids. Ids that don't exist are left out.
+    '''
+    groups = {}
+    for i in range(0, len(ids), BATCH_SIZE):
+        params = ParametersI()
+        params.addIds(ids[i:i + BATCH_SIZE])
+        rows = query_service.projection(
+            'select o.id, g.id from %s o'
+            ' left outer join o.details.group g'
+            ' where o.id in (:ids)' % data_type,
+            params, {'omero.group': '-1'})
+        for object_id, group_id in rows:
+            group_id = group_id.val if group_id is not None else None
+            groups.setdefault(group_id, []).append(object_id.val)
+    return groups
+
+
+def load_batches(query_service, data_type, ids, ctx, timing):
+    for i in range(0, len(ids), BATCH_SIZE):
+        params = ParametersI()
+        params.addIds(ids[i:i + BATCH_SIZE])
+        with timing.phase('load'):
+            objects = query_service.findAllByQuery(
+                'select o from %s o where o.id in (:ids)' % data_type,
+                params, ctx)
+        yield objects
+
+
+def apply_edits(session, edits, timing=None, prefetch=False):
+    '''
+    Load, edit and save the objects of a list of
+    (type, id, attribute, attribute type, value) edits. The objects of
+    each group are loaded and saved BATCH_SIZE at a time in that group's
+    context; with prefetch, the next batch is loaded while the current
+    one is saved. Returns the number of objects saved and the ids that
+    weren't found.
+    '''
+    if timing is None:
+        timing = ServiceTimer()
+    update_service = session.getUpdateService()
+    query_service = session.getQueryService()
+    saved = 0
+    missing = []
+    for data_type, object_edits in group_edits(edits).items():
+        with timing.phase('resolve'):
+            groups = resolve_groups(
+                query_service, data_type, sorted(object_edits))
+        for group_id, ids in groups.items():
+            ctx = {'omero.group': '-1'}
+            if group_id is not None:
+                ctx = {'omero.group': str(group_id)}
+            batches = load_batches(
+                query_service, data_type, ids, ctx, timing)
+            if prefetch:
+                batches = prefetched(batches)
+            for objects in batches:
+                for o in objects:
+                    for attribute, value in object_edits.pop(o.id.val):
+                        setattr(o, attribute, value)
+                with timing.phase('save'):
+                    update_service.saveArray(
+                        objects, ctx if group_id is not None else None)
+                saved += len(objects)
+        missing.extend('%s:%s' % (data_type, object_id)
+                       for object_id in sorted(object_edits))
+    return saved, missing
+
 
 def run():
     '''
@@ -36,13 +177,13 @@ def run():
         'Edit_Object_Attribute.py',
         'Edit the attributes of an object',
 
-        scripts.String('Data_Type', optional=False, grouping='1',
+        scripts.String('Data_Type', optional=True, grouping='1',
                        description='The data type you want to work with.'),
 
-        scripts.Long('ID', optional=False, grouping='2',
+        scripts.Long('ID', optional=True, grouping='2',
                      description='Object ID'),
 
-        scripts.String('Attribute', optional=False, grouping='3',
+        scripts.String('Attribute', optional=True, grouping='3',
                        description='Attribute to set'),
 
         scripts.String('Attribute_Type', optional=False, grouping='4',
@@ -54,10 +195,30 @@ def run():
                            rstring('String')
                        ], default='String'),
 
-        scripts.String('Value', optional=False, grouping='5',
+        scripts.String('Value', optional=True, grouping='5',
                        description='Value to set'),
 
-        version='0.1',
+        scripts.List('IDs', optional=True, grouping='6',
+                     description='Object IDs to edit in bulk, instead of'
+                                 ' ID').ofType(rlong(0)),
+
+        scripts.Long('CSV_File_ID', optional=True, grouping='7',
+                     description='ID of an uploaded CSV file of'
+                                 ' (type, id, attribute, value) rows to'
+                                 ' apply instead of the fields above'),
+
+        scripts.Bool('Timing_Trace', optional=True, grouping='8',
+                     default=False,
+                     description='Attach a JSON trace of every query and'
+                                 ' update call as a file output'),
+
+        scripts.Bool('Prefetch', optional=True, grouping='9',
+                     description='Load the next batch of objects on a'
+                                 ' background thread while the current'
+                                 ' one is saved',
+                     default=False),
+
+        version='0.2',
         authors=['Chris Allan'],
         institutions=['Glencoe Software Inc.'],
         contact='support@glencoesoftware.com',
@@ -69,39 +230,44 @@ def run():
             if client.getInput(key):
                 script_params[key] = client.getInput(key, unwrap=True)
 
-        session = client.getSession()
-        update_service = session.getUpdateService()
-        query_service = session.getQueryService()
-
-        value = script_params['Value']
-        if script_params['Attribute_Type'] == 'Bool':
-            value = rtype(bool(value))
-        elif script_params['Attribute_Type'] == 'Double':
-            value = rdouble(float(value))
-        elif script_params['Attribute_Type'] == 'Float':
-            value = rtype(float(value))
-        elif script_params['Attribute_Type'] == 'Int':
-            value = rtype(int(value))
-        elif script_params['Attribute_Type'] == 'Long':
-            value = rtype(int(value))
-        elif script_params['Attribute_Type'] == 'Time':
-            value = rtime(int(value))
+        timing = ServiceTimer(script_params.get('Timing_Trace', False))
+        session = timing.connection(client.getSession())
+        attribute_type = script_params['Attribute_Type']
+
+        if 'CSV_File_ID' in script_params:
+            with timing.phase('read'):
+                edits, bad_rows = read_csv_edits(
+                    session, script_params['CSV_File_ID'], attribute_type)
+            if bad_rows:
+                client.setOutput('Message', rstring(
+                    'Unknown attribute type in %d CSV row(s), nothing was'
+                    ' changed: %s.' % (len(bad_rows), ', '.join(
+                        bad_rows[:MAX_REPORTED]))))
+                return
         else:
-            value = rtype(value)
-
-        ctx = {'omero.group': '-1'}
-        o = query_service.get(
-            script_params['Data_Type'], script_params['ID'], ctx)
-        setattr(o, script_params['Attribute'], value)
-        ctx = None
-        try:
-            ctx = {'omero.group': str(o.details.group.id.val)}
-        except AttributeError:
-            pass
-        update_service.saveObject(o, ctx)
-
-        client.setOutput('Message', rstring(
-            'Setting of attribute successful.'))
+            absent = [key for key in ('Data_Type', 'Attribute', 'Value')
+                      if key not in script_params]
+            if not script_params.get('IDs') and 'ID' not in script_params:
+                absent.append('ID or IDs')
+            if absent:
+                client.setOutput('Message', rstring(
+                    'Missing input(s) without a CSV_File_ID: %s.'
+                    % ', '.join(absent)))
+                return
+            ids = script_params.get('IDs') or [script_params['ID']]
+            edits = [(script_params['Data_Type'], object_id,
+                      script_params['Attribute'], attribute_type,
+                      script_params['Value']) for object_id in ids]
+
+        saved, missing = apply_edits(
+            session, edits, timing, script_params.get('Prefetch', False))
+
+        total = len(set((edit[0], edit[1]) for edit in edits))
+        message = 'Updated %d of %d object(s).' % (saved, total)
+        if missing:
+            message += ' Not found: %s.' % ', '.join(missing)
+        client.setOutput('Message', rstring(message))
+        timing.report(client)
     finally:
         client.closeSession()
 
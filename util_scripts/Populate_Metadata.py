@@ -24,56 +24,631 @@ Populate metadata from CSV.
 
 import omero
 from omero.gateway import BlitzGateway
-from omero.rtypes import rstring
+from omero.rtypes import rlong, rstring
 import omero.scripts as scripts
 from omero.model import PlateI, ScreenI
+from omero.sys import ParametersI
 
+import csv
+import errno
+import hashlib
+import json
+import os
 import sys
+import tempfile
+import time
+
+import numpy as np
 
 from omero.util.populate_roi import DownloadingOriginalFileProvider
 from omero.util.populate_metadata import ParsingContext
 
+from omero_script_utils.instrumentation import ServiceTimer
+from omero_script_utils.paging import keysetPages
+
+try:
+    # Only the omero-metadata package can parse a file in batches.
+    from omero_metadata.populate import ParsingContext as \
+        StreamingParsingContext
+except ImportError:
+    StreamingParsingContext = None
+
+assert omero
+
+BLOCK_SIZE = 1024 * 1024
+CACHE_NAME = "Populate_Metadata_cache"
+# Partial cache files older than this were left behind by a failed job.
+STALE_PART_SECONDS = 24 * 60 * 60
+
+ORIGINAL_FILE_QUERY = """
+    SELECT f FROM FileAnnotation AS a
+    JOIN a.file AS f
+    WHERE f.id = :fid AND EXISTS (
+        SELECT l FROM %sAnnotationLink AS l
+        WHERE l.parent.id = :pid AND l.child.id = a.id)
+    """
+
 
 def get_original_file(conn, object_type, object_id, file_id):
-    if object_type == "Plate":
-        omero_object = conn.getObject("Plate", int(object_id))
-        if omero_object is None:
-            sys.stderr.write("Error: Plate does not exist.\n")
-            sys.exit(1)
-    else:
-        omero_object = conn.getObject("Screen", int(object_id))
-        if omero_object is None:
-            sys.stderr.write("Error: Screen does not exist.\n")
-            sys.exit(1)
-    file = None
-    for ann in omero_object.listAnnotations():
-        if isinstance(ann, omero.gateway.FileAnnotationWrapper):
-            print(("File ID:", ann.getFile().getId(), ann.getFile().getName(),
-                   "Size:", ann.getFile().getSize()))
-            if (ann.getFile().getId() == int(file_id)):
-                file = ann.getFile()._obj
+    """
+    Look up the OriginalFile of a FileAnnotation linked to the Plate or
+    Screen with a single query.
+    """
+    params = ParametersI()
+    params.addLong("pid", int(object_id))
+    params.addLong("fid", int(file_id))
+    file = conn.getQueryService().findByQuery(
+        ORIGINAL_FILE_QUERY % object_type, params, conn.SERVICE_OPTS)
     if file is None:
-        sys.stderr.write("Error: File does not exist.\n")
+        if conn.getObject(object_type, int(object_id)) is None:
+            sys.stderr.write("Error: %s does not exist.\n" % object_type)
+        else:
+            sys.stderr.write("Error: File does not exist.\n")
         sys.exit(1)
+    print(("File ID:", file.id.val, file.name.val, "Size:", file.size.val))
     return file
 
 
-def populate_metadata(client, conn, script_params):
-    object_id = int(script_params["IDs"])
-    file_id = int(script_params["File_ID"])
-    original_file = get_original_file(
-        conn, script_params["Data_Type"], object_id, file_id)
-    provider = DownloadingOriginalFileProvider(conn)
-    file_handle = provider.get_original_file_data(original_file)
-    if script_params["Data_Type"] == "Plate":
-        omero_object = PlateI(int(object_id), False)
+class RawFileLineReader(object):
+    """
+    Iterates over the lines of an OriginalFile, reading it through a raw
+    file store in fixed-size blocks so that the file is never held in
+    memory as a whole.
+    """
+
+    def __init__(self, conn, original_file, block_size=BLOCK_SIZE):
+        self.conn = conn
+        self.file_id = original_file.id.val
+        self.block_size = block_size
+
+    def decode(self, line):
+        if bytes is str:
+            return line
+        return line.decode("utf-8")
+
+    def iter_blocks(self):
+        store = self.conn.createRawFileStore()
+        try:
+            store.setFileId(self.file_id, self.conn.SERVICE_OPTS)
+            size = store.size()
+            offset = 0
+            while offset < size:
+                block = store.read(
+                    offset, min(self.block_size, size - offset))
+                if not block:
+                    break
+                offset += len(block)
+                yield block
+        finally:
+            store.close()
+
+    def __iter__(self):
+        remainder = b""
+        for block in self.iter_blocks():
+            lines = (remainder + block).split(b"\n")
+            remainder = lines.pop()
+            for line in lines:
+                yield self.decode(line + b"\n")
+        if remainder:
+            yield self.decode(remainder)
+
+
+def open_csv(path):
+    """
+    Open a local CSV file the way the csv module expects it.
+    """
+    if bytes is str:
+        return open(path, "rb")
+    return open(path, "r", newline="", encoding="utf-8")
+
+
+def cache_directory():
+    """
+    The cache directory under the var directory of the OMERO installation
+    running the script, or under ~/omero/var outside of one. It is created
+    accessible to the server's system user only; a shared temporary
+    directory would let other local users plant entries.
+    """
+    omero_dir = os.environ.get("OMERODIR") or os.environ.get("OMERO_HOME")
+    if omero_dir:
+        return os.path.join(omero_dir, "var", CACHE_NAME)
+    return os.path.join(os.path.expanduser("~"), "omero", "var", CACHE_NAME)
+
+
+class MetadataFileCache(object):
+    """
+    On-disk cache of metadata files keyed by the OriginalFile hash, id and
+    size. Each entry holds the raw bytes and the parsed CSV rows, one JSON
+    list per line; entries are evicted least recently used first once the
+    cache grows past max_bytes. Entries are written to temporary ".part"
+    files first, so that jobs caching the same file at once don't write
+    into each other's files.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def key(self, original_file):
+        file_hash = ""
+        if original_file.hash is not None:
+            file_hash = original_file.hash.val
+        return hashlib.sha1(("%s:%s:%s" % (
+            file_hash, original_file.id.val, original_file.size.val)
+        ).encode("utf-8")).hexdigest()
+
+    def paths(self, original_file):
+        base = os.path.join(self.directory, self.key(original_file))
+        return base + ".csv", base + ".jsonl"
+
+    def get(self, original_file):
+        """
+        Return the local path of a cached file, None on a cache miss.
+        """
+        raw_path, rows_path = self.paths(original_file)
+        if not os.path.exists(raw_path) or not os.path.exists(rows_path):
+            return None
+        os.utime(raw_path, None)
+        os.utime(rows_path, None)
+        return raw_path
+
+    def put(self, original_file, blocks):
+        """
+        Store the raw blocks of a file and its parsed rows, both written
+        as they are read, then evict old entries. Returns the local path
+        of the raw file.
+        """
+        raw_path, rows_path = self.paths(original_file)
+        raw_part = self.part_path()
+        rows_part = self.part_path()
+        try:
+            with open(raw_part, "wb") as raw_file:
+                for block in blocks:
+                    raw_file.write(block)
+            with open_csv(raw_part) as raw_file:
+                with open(rows_part, "w") as rows_file:
+                    for row in csv.reader(raw_file):
+                        if bytes is str:
+                            row = [value.decode("utf-8") for value in row]
+                        rows_file.write(json.dumps(row) + "\n")
+            os.rename(rows_part, rows_path)
+            os.rename(raw_part, raw_path)
+        except Exception:
+            for path in (raw_part, rows_part):
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        self.evict(keep=raw_path)
+        return raw_path
+
+    def part_path(self):
+        fd, path = tempfile.mkstemp(suffix=".part", dir=self.directory)
+        os.close(fd)
+        return path
+
+    def rows(self, original_file):
+        """
+        Iterate over the cached rows of a file, the way csv.reader would
+        return them.
+        """
+        with open(self.paths(original_file)[1]) as rows_file:
+            for line in rows_file:
+                row = json.loads(line)
+                if bytes is str:
+                    row = [value.encode("utf-8") for value in row]
+                yield row
+
+    def evict(self, keep=None):
+        """
+        Remove stale ".part" files, then the least recently used entries
+        until the cache fits in max_bytes. Recent ".part" files belong to
+        running jobs; they count towards the size but are left alone.
+        """
+        entries = []
+        total = 0
+        stale = time.time() - STALE_PART_SECONDS
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                try:
+                    if os.path.getmtime(path) < stale:
+                        print(("Removing stale file %s" % path))
+                        os.remove(path)
+                    else:
+                        total += os.path.getsize(path)
+                except OSError:
+                    # Renamed or removed by its job meanwhile.
+                    pass
+                continue
+            if not name.endswith(".csv"):
+                continue
+            size = os.path.getsize(path)
+            rows_path = path[:-len(".csv")] + ".jsonl"
+            if os.path.exists(rows_path):
+                size += os.path.getsize(rows_path)
+            entries.append((os.path.getmtime(path), path, size))
+            total += size
+        for mtime, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            print(("Evicting cached file %s" % path))
+            os.remove(path)
+            rows_path = path[:-len(".csv")] + ".jsonl"
+            if os.path.exists(rows_path):
+                os.remove(rows_path)
+            total -= size
+
+
+def get_file_opener(conn, original_file, script_params):
+    """
+    Fetch the metadata file once and return a function giving a fresh
+    handle on it for every target and one giving its CSV rows for the
+    checks. Streamed files are read again from the server for each pass
+    to keep memory bounded.
+    """
+    if script_params.get("Use_Cache", False):
+        cache = MetadataFileCache(
+            cache_directory(),
+            script_params.get("Cache_Size_MB", 2048) * 1024 * 1024)
+        path = cache.get(original_file)
+        if path is None:
+            path = cache.put(original_file, RawFileLineReader(
+                conn, original_file).iter_blocks())
+        else:
+            print(("Using cached file %s" % path))
+        return lambda: open_csv(path), lambda: cache.rows(original_file)
+    if script_params.get("Stream_File", False):
+        def open_file():
+            return RawFileLineReader(conn, original_file)
     else:
-        omero_object = ScreenI(int(object_id), False)
+        provider = DownloadingOriginalFileProvider(conn)
+        file_handle = provider.get_original_file_data(original_file)
+
+        def open_file():
+            file_handle.seek(0)
+            return file_handle
+    return open_file, lambda: csv.reader(open_file())
+
+
+def letters_to_row(letters):
+    if not letters.isalpha():
+        return -1
+    row = 0
+    for letter in letters:
+        row = row * 26 + ord(letter) - ord("A") + 1
+    return row - 1
+
+
+def parse_well_names(well_names):
+    """
+    Convert well names such as "B3", "b03" or "AF48" into zero based
+    (row, column) arrays, -1 where a name can't be parsed. Only the
+    distinct letter and digit parts are converted in Python.
+    """
+    names = np.char.upper(np.char.strip(np.asarray(well_names, dtype=str)))
+    letters = np.char.rstrip(names, "0123456789")
+    digits = np.char.lstrip(names, "ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+    unique_letters, letter_index = np.unique(letters, return_inverse=True)
+    unique_rows = np.array(
+        [letters_to_row(str(value)) for value in unique_letters],
+        dtype=np.int64)
+    unique_digits, digit_index = np.unique(digits, return_inverse=True)
+    unique_columns = np.array(
+        [int(value) - 1 if str(value).isdigit() else -1
+         for value in unique_digits], dtype=np.int64)
+    return (unique_rows.reshape(-1)[letter_index],
+            unique_columns.reshape(-1)[digit_index])
+
+
+class WellIndex(object):
+    """
+    Positions of the wells of a Plate, or of every Plate of a Screen,
+    built from one (well id, row, column, plate name) projection and kept
+    as sorted int64 keys so that CSV rows are resolved in one vectorized
+    pass. It only backs the Check_Wells pre-check; ParsingContext still
+    resolves the rows itself when the table is written. Wells without a
+    row or column can't be addressed by a well name and are left out.
+    """
+
+    QUERY = """
+        SELECT w.id, w.row, w.column, p.name FROM Well AS w
+        JOIN w.plate AS p
+        WHERE %s AND w.id > :last
+        ORDER BY w.id
+        """
+
+    def __init__(self, conn, object_type, object_id):
+        params = ParametersI()
+        params.addId(object_id)
+        if object_type == "Plate":
+            where = "p.id = :id"
+        else:
+            where = "p.id IN (SELECT l.child.id FROM ScreenPlateLink AS l" \
+                " WHERE l.parent.id = :id)"
+        rows = []
+        self.skipped = 0
+        for page in keysetPages(
+                conn.getQueryService(), self.QUERY % where, params,
+                ctx=conn.SERVICE_OPTS):
+            for row in page:
+                if row[1] is None or row[2] is None:
+                    self.skipped += 1
+                else:
+                    rows.append(row)
+        if self.skipped:
+            print(("Skipped %d well(s) of %s %d without a row or column"
+                   % (self.skipped, object_type, object_id)))
+        well_ids = np.array([row[0].val for row in rows], dtype=np.int64)
+        well_rows = np.array([row[1].val for row in rows], dtype=np.int64)
+        well_columns = np.array(
+            [row[2].val for row in rows], dtype=np.int64)
+        plate_names = np.array([row[3].val for row in rows], dtype=str)
+        self.plate_names = np.unique(plate_names)
+        keys = self.key(np.searchsorted(self.plate_names, plate_names),
+                        well_rows, well_columns)
+        order = np.argsort(keys)
+        self.keys = keys[order]
+        self.well_ids = well_ids[order]
+
+    def key(self, plate_codes, rows, columns):
+        return (plate_codes * 1000 + rows) * 1000 + columns
+
+    def resolve(self, well_names, plate_names=None):
+        """
+        Return the well id of every CSV row, -1 where it doesn't match a
+        well of the index.
+        """
+        rows, columns = parse_well_names(well_names)
+        valid = (rows >= 0) & (columns >= 0)
+        if plate_names is None or len(self.plate_names) <= 1:
+            plate_codes = np.zeros(len(rows), dtype=np.int64)
+        else:
+            plate_names = np.asarray(plate_names, dtype=str)
+            plate_codes = np.searchsorted(self.plate_names, plate_names)
+            found = np.minimum(plate_codes, len(self.plate_names) - 1)
+            valid &= self.plate_names[found] == plate_names
+        if len(self.keys) == 0:
+            return np.full(len(rows), -1, dtype=np.int64)
+        keys = self.key(plate_codes, rows, columns)
+        positions = np.minimum(
+            np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        valid &= self.keys[positions] == keys
+        return np.where(valid, self.well_ids[positions], -1)
+
+
+NUMERIC_TYPES = {"d": np.float64, "l": np.int64}
+BOOLEAN_VALUES = set(["", "true", "false", "yes", "no", "1", "0"])
+MAX_REPORTED = 20
+
+
+class CsvTable(object):
+    """
+    Column oriented view of the CSV rows, used to check the file before
+    anything is written. The optional "# header" line of column types
+    understood by ParsingContext is honoured. The whole file is held in
+    memory, so the checks using it are off by default with Stream_File.
+    """
+
+    def __init__(self, rows):
+        rows = iter(rows)
+        first = next(rows, [])
+        line = 1
+        self.types = None
+        if first and first[0].strip().lower().startswith("# header"):
+            self.types = [first[0].strip()[len("# header"):].strip()] \
+                + [value.strip() for value in first[1:]]
+            first = next(rows, [])
+            line += 1
+        self.header = [name.strip() for name in first]
+        self.ragged = []
+        body = []
+        lines = []
+        width = len(self.header)
+        for row in rows:
+            line += 1
+            if len(row) == 0:
+                continue
+            if len(row) != width:
+                self.ragged.append((line, len(row)))
+                row = (row + [""] * width)[:width]
+            body.append(row)
+            lines.append(line)
+        self.lines = np.array(lines, dtype=np.int64)
+        if body:
+            self.columns = [np.array(column, dtype=str)
+                            for column in zip(*body)]
+        else:
+            self.columns = [np.zeros(0, dtype=str) for name in self.header]
+
+    def column(self, name):
+        """
+        Return a column by case insensitive name, None if it's missing.
+        """
+        names = [header.lower() for header in self.header]
+        if name.lower() not in names:
+            return None
+        return self.columns[names.index(name.lower())]
+
+    def bad_rows(self, values, column_type):
+        """
+        Indexes of the values that don't convert to column_type. Whole
+        columns are converted at once; values are only looked at one by
+        one when that fails.
+        """
+        values = np.char.strip(values)
+        if column_type == "b":
+            lowered = np.char.lower(values)
+            return [i for i, value in enumerate(lowered)
+                    if str(value) not in BOOLEAN_VALUES]
+        if column_type not in NUMERIC_TYPES:
+            return []
+        present = np.nonzero(values != "")[0]
+        dtype = NUMERIC_TYPES[column_type]
+        try:
+            values[present].astype(dtype)
+            return []
+        except (ValueError, OverflowError):
+            pass
+        bad = []
+        for i in present:
+            try:
+                np.array([values[i]]).astype(dtype)
+            except (ValueError, OverflowError):
+                bad.append(i)
+        return bad
+
+    def validate(self, key_columns=None):
+        """
+        Check row lengths, the values of every column with a declared
+        type and, when key_columns are given, that no two rows share a
+        key. Columns without a declared type get their type from the
+        parser, which looks at all of their values, so they are not
+        checked. Returns a list of error messages.
+        """
+        errors = ["line %d: %d value(s) instead of %d" % (
+            line, size, len(self.header))
+            for line, size in self.ragged[:MAX_REPORTED]]
+        if self.types is None:
+            declared = 0
+        else:
+            declared = min(len(self.types), len(self.header))
+        for i in range(declared):
+            name = self.header[i]
+            values = self.columns[i]
+            column_type = self.types[i].lower()
+            bad = self.bad_rows(values, column_type)
+            if bad:
+                errors.append("column %s (%s): %d bad value(s)" % (
+                    name, column_type, len(bad)))
+            for j in bad[:MAX_REPORTED]:
+                errors.append("\tline %d: '%s'" % (
+                    self.lines[j], values[j]))
+        if key_columns:
+            errors.extend(self.duplicate_keys(key_columns))
+        return errors
+
+    def duplicate_keys(self, key_columns):
+        keys = None
+        for name in key_columns:
+            values = self.column(name)
+            if values is None:
+                return ["key column %s is missing" % name]
+            values = np.char.strip(values)
+            if keys is None:
+                keys = values
+            else:
+                keys = np.char.add(np.char.add(keys, "\x1f"), values)
+        unique, inverse, counts = np.unique(
+            keys, return_inverse=True, return_counts=True)
+        duplicated = np.nonzero(counts[inverse.reshape(-1)] > 1)[0]
+        if len(duplicated) == 0:
+            return []
+        errors = ["%d row(s) share a key (%s)" % (
+            len(duplicated), ", ".join(key_columns))]
+        for j in duplicated[:MAX_REPORTED]:
+            errors.append("\tline %d: %s" % (
+                self.lines[j], str(keys[j]).replace("\x1f", ", ")))
+        return errors
+
+
+def check_wells(conn, object_type, object_id, table):
+    """
+    Resolve every CSV row against the target's wells and exit, before
+    anything is written, if some of them don't match.
+    """
+    wells = table.column("well")
+    index = WellIndex(conn, object_type, object_id)
+    well_ids = index.resolve(wells, table.column("plate"))
+    unmatched = np.nonzero(well_ids < 0)[0]
+    if len(unmatched) == 0:
+        return
+    sys.stderr.write(
+        "Error: %d row(s) don't match a well of %s %d:\n" % (
+            len(unmatched), object_type, object_id))
+    for i in unmatched[:MAX_REPORTED]:
+        sys.stderr.write("\tline %d: %s\n" % (table.lines[i], wells[i]))
+    sys.exit(1)
+
+
+def populate_target(client, omero_object, open_file, script_params):
+    if script_params.get("Stream_File", False):
+        # Two passes over the file: the first collects what the columns
+        # need, the second writes the table in batches.
+        ctx = StreamingParsingContext(
+            client, omero_object, "",
+            batch_size=script_params.get("Batch_Size", 1000))
+        ctx.preprocess_from_handle(open_file())
+        ctx.parse_from_handle_stream(open_file())
+        return
     ctx = ParsingContext(client, omero_object, "")
-    ctx.parse_from_handle(file_handle)
+    ctx.parse_from_handle(open_file())
     ctx.write_to_omero()
 
 
+def populate_metadata(client, conn, script_params, timing=None):
+    if timing is None:
+        timing = ServiceTimer()
+    conn = timing.connection(conn)
+    data_type = script_params["Data_Type"]
+    object_ids = []
+    for object_id in script_params.get("IDs") or []:
+        if object_id not in object_ids:
+            object_ids.append(object_id)
+    if not object_ids:
+        sys.stderr.write("Error: no %s IDs given.\n" % data_type)
+        sys.exit(1)
+    if script_params.get("Stream_File", False) \
+            and StreamingParsingContext is None:
+        sys.stderr.write("Error: Stream_File needs the omero-metadata"
+                         " package.\n")
+        sys.exit(1)
+    file_id = int(script_params["File_ID"])
+    # Check every target before anything is written.
+    with timing.phase("lookup"):
+        for object_id in object_ids:
+            original_file = get_original_file(
+                conn, data_type, object_id, file_id)
+    open_file, read_rows = get_file_opener(
+        conn, original_file, script_params)
+    # The checks hold the whole file in memory, which streaming avoids.
+    streaming = script_params.get("Stream_File", False)
+    validate = script_params.get("Validate", not streaming)
+    check = script_params.get("Check_Wells", not streaming)
+    if validate or check:
+        with timing.phase("read"):
+            table = CsvTable(read_rows())
+    if validate:
+        key_columns = [name.strip() for name in script_params.get(
+            "Key_Columns", "").split(",") if name.strip()]
+        with timing.phase("validate"):
+            errors = table.validate(key_columns)
+        if errors:
+            sys.stderr.write("Error: the file didn't validate:\n")
+            sys.stderr.write("\n".join(errors) + "\n")
+            sys.exit(1)
+    if check and table.column("well") is not None:
+        with timing.phase("check"):
+            for object_id in object_ids:
+                check_wells(conn, data_type, object_id, table)
+    for object_id in object_ids:
+        if data_type == "Plate":
+            omero_object = PlateI(object_id, False)
+        else:
+            omero_object = ScreenI(object_id, False)
+        print(("Populating %s %d" % (data_type, object_id)))
+        with timing.phase("populate"):
+            populate_target(
+                client, omero_object, open_file, script_params)
+    return "Metadata populated for %d %s(s)." % (len(object_ids), data_type)
+
+
 if __name__ == "__main__":
     dataTypes = [rstring('Plate'), rstring('Screen')]
     client = scripts.client(
@@ -85,14 +660,59 @@ if __name__ == "__main__":
             description="Choose source of images",
             values=dataTypes, default="Plate"),
 
-        scripts.String(
+        scripts.List(
             "IDs", optional=False, grouping="2",
-            description="List of Image IDs to process."),
+            description="List of Plate or Screen IDs to populate from the"
+            " same file.").ofType(rlong(0)),
 
         scripts.String(
             "File_ID", optional=False, grouping="3", default='',
             description="File ID containing metadata to populate."),
 
+        scripts.Bool(
+            "Stream_File", optional=True, grouping="4", default=False,
+            description="Read the file in blocks, twice, and write the"
+            " table in batches so that the file is never held in memory."
+            " Needs the omero-metadata package."),
+
+        scripts.Int(
+            "Batch_Size", optional=True, grouping="5", default=1000,
+            min=1, description="Rows parsed and written per batch with"
+            " Stream_File."),
+
+        scripts.Bool(
+            "Use_Cache", optional=True, grouping="6", default=False,
+            description="Keep the file and its parsed rows in a cache"
+            " under the server's var directory and reuse them on later"
+            " runs: the file isn't downloaded again and the checks read"
+            " the parsed rows."),
+
+        scripts.Int(
+            "Cache_Size_MB", optional=True, grouping="7", default=2048,
+            min=1, description="Size limit of the local cache."),
+
+        scripts.Bool(
+            "Check_Wells", optional=True, grouping="8",
+            description="Check that every CSV row matches a well of the"
+            " target before writing. Reads the whole file into memory;"
+            " on unless Stream_File is set."),
+
+        scripts.Bool(
+            "Validate", optional=True, grouping="9",
+            description="Check row lengths and the values of columns with"
+            " declared types before writing. Reads the whole file into"
+            " memory; on unless Stream_File is set."),
+
+        scripts.String(
+            "Key_Columns", optional=True, grouping="10",
+            description="Comma separated columns that must be unique"
+            " together, e.g. 'Plate,Well,Field'."),
+
+        scripts.Bool(
+            "Timing_Trace", optional=True, grouping="11", default=False,
+            description="Attach a JSON trace of every query and update"
+            " call as a file output."),
+
         version="0.2",
         authors=["Emil Rozbicki"],
         institutions=["Glencoe Software Inc."],
@@ -109,8 +729,10 @@ if __name__ == "__main__":
 
         # wrap client to use the Blitz Gateway
         conn = BlitzGateway(client_obj=client)
-        message = populate_metadata(client, conn, scriptParams)
+        timing = ServiceTimer(scriptParams.get("Timing_Trace", False))
+        message = populate_metadata(client, conn, scriptParams, timing)
         client.setOutput("Message", rstring(message))
+        timing.report(client)
 
     finally:
         client.closeSession()